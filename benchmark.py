@@ -0,0 +1,358 @@
+"""Benchmark de los endpoints del webhook.
+
+Envía notificaciones sintéticas de Mercado Pago (payment/transfer/otras, de
+distintos tamaños, con duplicados y con o sin firma) y mide throughput,
+latencias p50/p99/p999 y crecimiento de memoria. Puede correr en el mismo
+proceso con el test client de Flask o por socket contra gunicorn:
+
+    python benchmark.py inprocess --requests 20000 --output bench.json
+    python benchmark.py socket --requests 20000 --concurrency 16 --output bench.json
+    python benchmark.py socket --url http://127.0.0.1:8080 --requests 5000
+"""
+import argparse
+import hashlib
+import hmac
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+BENCH_SECRET = "benchmark-secret"
+PAYLOAD_SIZES = {"small": 0, "medium": 1024, "large": 16 * 1024}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 4) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4) if latencies else None,
+        "p999_ms": round(percentile(latencies, 0.999) * 1000, 4) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 4) if latencies else None,
+    }
+
+
+def rss_kb(pid="self"):
+    """Memoria residente de un proceso en KB (Linux)"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class PayloadFactory:
+    """Genera notificaciones sintéticas con una mezcla de tipos, tamaños, duplicados y firmas"""
+
+    def __init__(self, size="small", duplicate_ratio=0.1, signed=False, seed=1):
+        self.padding = "x" * PAYLOAD_SIZES[size]
+        self.duplicate_ratio = duplicate_ratio
+        self.signed = signed
+        self._random = random.Random(seed)
+        self._sent = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def _notification(self, notification_id):
+        kind = self._random.choices(("payment", "transfer", "merchant_order"), weights=(70, 20, 10))[0]
+        data = {"id": str(notification_id)}
+        if kind != "merchant_order":
+            data.update({
+                "amount": round(self._random.uniform(10, 50000), 2),
+                "currency": "ARS",
+                "status": self._random.choice(("approved", "pending", "rejected")),
+            })
+        if self.padding:
+            data["description"] = self.padding
+        return {
+            "id": notification_id,
+            "type": kind,
+            "action": f"{kind}.created",
+            "live_mode": False,
+            "date_created": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "data": data,
+        }
+
+    def next(self):
+        """Devuelve (path con query, body en bytes, headers)"""
+        with self._lock:
+            if self._sent and self._random.random() < self.duplicate_ratio:
+                notification = self._random.choice(self._sent)
+            else:
+                notification = self._notification(self._next_id)
+                self._next_id += 1
+                if len(self._sent) < 10000:
+                    self._sent.append(notification)
+            request_number = self._next_id
+        body = json.dumps(notification).encode("utf-8")
+        data_id = notification["data"]["id"]
+        headers = {"Content-Type": "application/json"}
+        if self.signed:
+            request_id = f"bench-{request_number}-{time.monotonic_ns()}"
+            ts = str(int(time.time()))
+            manifest = f"id:{data_id};request-id:{request_id};ts:{ts};"
+            digest = hmac.new(BENCH_SECRET.encode("utf-8"), manifest.encode("utf-8"), hashlib.sha256).hexdigest()
+            headers["X-Signature"] = f"ts={ts},v1={digest}"
+            headers["X-Request-Id"] = request_id
+        query = urllib.parse.urlencode({"data.id": data_id, "type": notification["type"]})
+        return f"/webhook?{query}", body, headers
+
+
+def bench_inprocess(args):
+    """Corre el benchmark con el test client de Flask, sin red"""
+    os.environ.setdefault("WEBHOOK_PROCESSING_MODE", args.mode)
+    # Toda la carga sale de una sola IP: sin límite por origen salvo que se pida
+    os.environ.setdefault("WEBHOOK_RATE_LIMIT", "0")
+    if args.signed:
+        os.environ["MP_VERIFY_SIGNATURE"] = "1"
+        os.environ["MP_WEBHOOK_SECRETS"] = BENCH_SECRET
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+
+    client = server.app.test_client()
+    factory = PayloadFactory(args.size, args.duplicates, args.signed)
+    statuses = {}
+    rss_before = rss_kb()
+
+    def post_batch(count):
+        latencies = []
+        for _ in range(count):
+            path, body, headers = factory.next()
+            started = time.perf_counter()
+            response = client.post(path, data=body, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return latencies
+
+    post_batch(min(args.warmup, args.requests))
+    statuses.clear()
+    started = time.perf_counter()
+    latencies = post_batch(args.requests)
+    webhook = summarize(latencies, time.perf_counter() - started)
+    webhook["status_codes"] = {str(code): count for code, count in sorted(statuses.items())}
+    webhook["rss_growth_kb"] = (rss_kb() or 0) - (rss_before or 0)
+
+    # Costo del monitor: primer render tras una notificación nueva (sin caché) y pedidos repetidos
+    view = {"history_size": len(server.notifications_history)}
+    uncached = []
+    cached = []
+    for _ in range(args.view_requests):
+        path, body, headers = factory.next()
+        client.post(path, data=body, headers=headers)
+        started = time.perf_counter()
+        response = client.get("/webhook/view")
+        uncached.append(time.perf_counter() - started)
+        etag = response.headers.get("ETag")
+        started = time.perf_counter()
+        client.get("/webhook/view", headers={"If-None-Match": etag} if etag else {})
+        cached.append(time.perf_counter() - started)
+    view["render"] = summarize(uncached, sum(uncached))
+    view["conditional_get"] = summarize(cached, sum(cached))
+    view["html_bytes"] = len(response.get_data())
+
+    api = []
+    for _ in range(args.view_requests):
+        started = time.perf_counter()
+        client.get("/webhook/notifications?type=payment&limit=50")
+        api.append(time.perf_counter() - started)
+
+    server.shutdown(timeout=10)
+    return {
+        "webhook": webhook,
+        "view": view,
+        "notifications_api": summarize(api, sum(api)),
+        "rss_kb": rss_kb(),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(host, port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"El servidor no respondió en {host}:{port}")
+
+
+def gunicorn_worker_pids(master_pid):
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children", encoding="utf-8") as children:
+            return [int(pid) for pid in children.read().split()]
+    except OSError:
+        return []
+
+
+def gunicorn_rss_kb(master_pid):
+    return sum(rss_kb(pid) or 0 for pid in [master_pid] + gunicorn_worker_pids(master_pid))
+
+
+def bench_socket(args):
+    """Corre el benchmark por HTTP contra gunicorn (lanzado acá) o contra --url"""
+    process = None
+    if args.url:
+        target = urllib.parse.urlsplit(args.url)
+        host, port = target.hostname, target.port or 80
+    else:
+        host, port = "127.0.0.1", free_port()
+        here = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, PORT=str(port), WEBHOOK_PROCESSING_MODE=args.mode)
+        env.setdefault("WEB_CONCURRENCY", str(args.workers))
+        env.setdefault("WEBHOOK_RATE_LIMIT", "0")
+        if args.signed:
+            env.update(MP_VERIFY_SIGNATURE="1", MP_WEBHOOK_SECRETS=BENCH_SECRET)
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", os.path.join(here, "gunicorn.conf.py"), "server:app"],
+            cwd=here, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+    try:
+        wait_for_server(host, port)
+        if process is not None:
+            # Dar tiempo a que gunicorn levante todos los workers
+            time.sleep(1)
+            rss_before = gunicorn_rss_kb(process.pid)
+        factory = PayloadFactory(args.size, args.duplicates, args.signed)
+        statuses = {}
+        latencies = []
+        lock = threading.Lock()
+        per_thread = args.requests // args.concurrency
+
+        def client(count, record):
+            # Una conexión keep-alive por hilo, como hace Mercado Pago
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+            local_latencies = []
+            local_statuses = {}
+            for _ in range(count):
+                path, body, headers = factory.next()
+                started = time.perf_counter()
+                try:
+                    connection.request("POST", path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    connection = http.client.HTTPConnection(host, port, timeout=30)
+                    status = "error"
+                local_latencies.append(time.perf_counter() - started)
+                local_statuses[status] = local_statuses.get(status, 0) + 1
+            connection.close()
+            if record:
+                with lock:
+                    latencies.extend(local_latencies)
+                    for status, count_for_status in local_statuses.items():
+                        statuses[status] = statuses.get(status, 0) + count_for_status
+
+        def run(count, record):
+            threads = [threading.Thread(target=client, args=(count, record)) for _ in range(args.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        run(max(1, args.warmup // args.concurrency), record=False)
+        started = time.perf_counter()
+        run(per_thread, record=True)
+        webhook = summarize(latencies, time.perf_counter() - started)
+        webhook["status_codes"] = {str(code): count for code, count in sorted(statuses.items(), key=str)}
+        webhook["concurrency"] = args.concurrency
+
+        view_latencies = []
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        for _ in range(args.view_requests):
+            started = time.perf_counter()
+            connection.request("GET", "/webhook/view")
+            response = connection.getresponse()
+            html = response.read()
+            view_latencies.append(time.perf_counter() - started)
+        connection.close()
+        view = summarize(view_latencies, sum(view_latencies))
+        view["html_bytes"] = len(html) if args.view_requests else None
+
+        result = {"webhook": webhook, "view": view}
+        if process is not None:
+            result["rss_kb"] = gunicorn_rss_kb(process.pid)
+            result["rss_growth_kb"] = result["rss_kb"] - rss_before
+            result["workers"] = len(gunicorn_worker_pids(process.pid))
+        return result
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=60)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de los endpoints del webhook de Mercado Pago")
+    parser.add_argument("target", choices=("inprocess", "socket"), help="test client de Flask o HTTP contra gunicorn")
+    parser.add_argument("--requests", type=int, default=5000, help="notificaciones a enviar")
+    parser.add_argument("--warmup", type=int, default=500, help="notificaciones de calentamiento (no se miden)")
+    parser.add_argument("--concurrency", type=int, default=8, help="clientes concurrentes (sólo socket)")
+    parser.add_argument("--workers", type=int, default=1, help="workers de gunicorn (sólo socket)")
+    parser.add_argument("--url", help="servidor ya levantado en lugar de lanzar gunicorn (sólo socket)")
+    parser.add_argument("--size", choices=sorted(PAYLOAD_SIZES), default="small", help="tamaño del payload")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="proporción de reenvíos duplicados")
+    parser.add_argument("--signed", action="store_true", help="firmar las notificaciones con x-signature")
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync", help="WEBHOOK_PROCESSING_MODE")
+    parser.add_argument("--view-requests", type=int, default=50, help="pedidos a /webhook/view")
+    parser.add_argument("--output", help="archivo JSON donde guardar los resultados")
+    args = parser.parse_args(argv)
+
+    # Evitar que el logging por request domine la medición en el mismo proceso
+    import logging
+    logging.disable(logging.INFO)
+
+    results = bench_inprocess(args) if args.target == "inprocess" else bench_socket(args)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
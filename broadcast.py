@@ -0,0 +1,69 @@
+import json
+import threading
+
+
+class TooManySubscribersError(Exception):
+    """Se alcanzó el máximo de clientes conectados al stream"""
+
+
+class NotificationBroadcaster:
+    """Reparte las notificaciones nuevas del historial a los clientes SSE.
+
+    Además de cada notificación nueva ("notification", con su seq como id),
+    envía "update" cuando una ya enviada se completa con los datos de la API.
+
+    No hay una cola por suscriptor: cada cliente recuerda el último número de
+    secuencia que recibió y lee del buffer circular lo que llegó después, así
+    que un cliente inactivo sólo ocupa su espera sobre la condición del
+    historial. Con workers gevent de gunicorn esa espera es un greenlet y no un
+    hilo del sistema.
+    """
+
+    def __init__(self, history, serialize, max_subscribers=500, heartbeat=15):
+        self._history = history
+        self._serialize = serialize
+        self.max_subscribers = max_subscribers
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self.subscribers = 0
+
+    def subscribe(self, last_event_id=None):
+        """Devuelve un generador de eventos SSE a partir de `last_event_id`"""
+        with self._lock:
+            if self.subscribers >= self.max_subscribers:
+                raise TooManySubscribersError("Demasiados clientes conectados")
+            self.subscribers += 1
+        newest = self._history.version - 1
+        # Un id desconocido (por ejemplo de antes de un reinicio) se trata como "desde ahora"
+        if last_event_id is None or last_event_id > newest:
+            last_seq = newest
+        else:
+            last_seq = last_event_id
+        return self._events(last_seq)
+
+    def _events(self, last_seq):
+        # Próxima actualización (entrada completada con datos de la API) a reenviar
+        next_update = self._history.update_version
+        try:
+            # Indicar al navegador cuánto esperar antes de reconectarse
+            yield "retry: 3000\n\n"
+            while True:
+                entries = self._history.since(last_seq)
+                updates = self._history.updates_since(next_update)
+                if not entries and not updates:
+                    if not self._history.wait_for_change(last_seq + 1, self.heartbeat, next_update):
+                        # Comentario SSE para mantener viva la conexión a través de proxies
+                        yield ": ping\n\n"
+                    continue
+                for number, entry in updates:
+                    next_update = number + 1
+                    # Las que todavía no se enviaron salen completas como notificación
+                    if entry.seq <= last_seq:
+                        yield f"event: update\ndata: {json.dumps(self._serialize(entry))}\n\n"
+                for entry in entries:
+                    payload = json.dumps(self._serialize(entry))
+                    yield f"id: {entry.seq}\nevent: notification\ndata: {payload}\n\n"
+                    last_seq = entry.seq
+        finally:
+            with self._lock:
+                self.subscribers -= 1
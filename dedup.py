@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+def notification_key(data):
+    """Clave de deduplicación: id de la notificación + tipo + acción.
+
+    Devuelve None si la notificación no trae ningún id (no se deduplica).
+    """
+    notification_id = data.get('id')
+    if notification_id is None:
+        resource = data.get('data')
+        if isinstance(resource, dict):
+            notification_id = resource.get('id')
+    if notification_id is None:
+        return None
+    return f"{data.get('type')}:{data.get('action')}:{notification_id}"
+
+
+class SqliteDedupBackend:
+    """Respaldo persistente del índice para sobrevivir reinicios y compartirlo entre procesos"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS seen_notifications (key TEXT PRIMARY KEY, expires REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        # Una conexión abierta antes de un fork no se puede usar en el proceso hijo
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Con WAL alcanza con sincronizar en cada checkpoint, no en cada commit
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    def check_and_add(self, key, now, expires):
+        """Registra la clave; devuelve True si ya existía y no había expirado"""
+        with self._lock:
+            cursor = self._connection().execute(
+                "INSERT INTO seen_notifications (key, expires) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET expires = excluded.expires "
+                "WHERE seen_notifications.expires <= ?",
+                (key, expires, now),
+            )
+            return cursor.rowcount == 0
+
+    def delete(self, key):
+        with self._lock:
+            self._connection().execute("DELETE FROM seen_notifications WHERE key = ?", (key,))
+
+    def purge(self, now):
+        with self._lock:
+            self._connection().execute("DELETE FROM seen_notifications WHERE expires <= ?", (now,))
+
+
+class DedupIndex:
+    """Índice en memoria de notificaciones ya vistas, con expiración por TTL.
+
+    Usa un diccionario clave -> tick de expiración y una rueda de tiempo con un
+    conjunto de claves por tick, de modo que expirar cuesta proporcional a lo que
+    vence y no al tamaño del índice.
+    """
+
+    def __init__(self, ttl=86400, resolution=60, max_keys=1_000_000, backend=None):
+        self.ttl = ttl
+        self.resolution = resolution
+        self.max_keys = max_keys
+        self._backend = backend
+        self._ticks_per_ttl = max(1, -(-ttl // resolution))
+        self._wheel = [set() for _ in range(self._ticks_per_ttl + 1)]
+        self._expiry = {}
+        self._tick = self._now_tick()
+        self._lock = threading.Lock()
+        self.unique = 0
+        self.duplicates = 0
+
+    def _now_tick(self):
+        return int(time.time() // self.resolution)
+
+    def seen(self, key):
+        """Registra la clave; devuelve True si es un duplicado dentro del TTL.
+
+        Con respaldo, la consulta a SQLite se hace fuera del lock del índice
+        para que una escritura lenta no frene a los demás hilos; el INSERT del
+        respaldo es atómico, así que de dos hilos con la misma clave sólo uno
+        la registra como nueva.
+        """
+        with self._lock:
+            now_tick = self._now_tick()
+            advanced = self._advance(now_tick)
+            expires = self._expiry.get(key)
+            if expires is not None and expires > now_tick:
+                self.duplicates += 1
+                return True
+            if self._backend is None:
+                self._add(key, now_tick + self._ticks_per_ttl)
+                self.unique += 1
+                return False
+        now = time.time()
+        if advanced:
+            self._backend.purge(now)
+        duplicate = self._backend.check_and_add(key, now, now + self.ttl)
+        with self._lock:
+            if duplicate:
+                self.duplicates += 1
+                return True
+            self._add(key, now_tick + self._ticks_per_ttl)
+            self.unique += 1
+            return False
+
+    def forget(self, key):
+        """Olvida una clave registrada por seen(), para que el reintento de una
+        notificación que no se pudo guardar o procesar no se tome como duplicado"""
+        with self._lock:
+            expires = self._expiry.pop(key, None)
+            if expires is not None:
+                self._wheel[expires % len(self._wheel)].discard(key)
+                self.unique -= 1
+        if self._backend is not None:
+            self._backend.delete(key)
+
+    def _add(self, key, expires):
+        self._expiry[key] = expires
+        self._wheel[expires % len(self._wheel)].add(key)
+        # Si se supera el máximo se adelanta el vencimiento de los ticks más viejos
+        tick = self._tick
+        while len(self._expiry) > self.max_keys:
+            tick += 1
+            self._expire_slot(tick, force=True)
+
+    def _advance(self, now_tick):
+        """Expira los ticks vencidos; devuelve True si la rueda avanzó"""
+        if now_tick <= self._tick:
+            return False
+        # Nunca hace falta recorrer más de una vuelta completa de la rueda
+        start = max(self._tick + 1, now_tick - len(self._wheel) + 1)
+        for tick in range(start, now_tick + 1):
+            self._expire_slot(tick)
+        self._tick = now_tick
+        return True
+
+    def _expire_slot(self, tick, force=False):
+        slot = self._wheel[tick % len(self._wheel)]
+        for key in list(slot):
+            expires = self._expiry.get(key)
+            if expires is None or force or expires <= tick:
+                slot.discard(key)
+                self._expiry.pop(key, None)
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "keys": len(self._expiry),
+                "unique": self.unique,
+                "duplicates": self.duplicates,
+                "ttl": self.ttl,
+            }
@@ -0,0 +1,411 @@
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class HandlerTimeoutError(Exception):
+    """El handler no terminó dentro de su tiempo máximo"""
+
+
+class HandlerPoolFullError(Exception):
+    """El pool del tipo de notificación tiene demasiados trabajos pendientes"""
+
+
+def tail_lines(path, limit, block_size=64 * 1024):
+    """Últimas `limit` líneas del archivo, leyendo bloques desde el final"""
+    try:
+        letters_file = open(path, "rb")
+    except FileNotFoundError:
+        return []
+    with letters_file:
+        position = letters_file.seek(0, os.SEEK_END)
+        data = b""
+        # Una línea más de las pedidas: la primera del bloque puede estar cortada
+        while position > 0 and data.count(b"\n") <= limit:
+            step = min(block_size, position)
+            position -= step
+            letters_file.seek(position)
+            data = letters_file.read(step) + data
+    lines = data.splitlines()
+    if position > 0:
+        lines = lines[1:]
+    return lines[-limit:]
+
+
+class DeadLetterStore:
+    """Notificaciones cuyo handler falló, venció o no tuvo lugar en su pool.
+
+    Guarda las últimas `capacity` en memoria y, con `path`, agrega cada una
+    como una línea JSON al archivo (compartido por todos los workers). Cuando
+    el archivo supera `max_bytes` se renombra a "<path>.1" (reemplazando al
+    anterior) y se empieza uno nuevo, así nunca crece sin límite.
+    """
+
+    def __init__(self, capacity=1000, path=None, max_bytes=16 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._letters = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+        self.total = 0
+
+    def add(self, letter):
+        line = (json.dumps(letter, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            self._letters.append(letter)
+            self.total += 1
+            if self.path is None:
+                return
+            self._open_current()
+            # Una sola escritura con O_APPEND: las líneas de distintos workers no se mezclan
+            os.write(self._fd, line)
+            if os.fstat(self._fd).st_size >= self.max_bytes:
+                self._rotate()
+
+    def _open_current(self):
+        # Reabrir después de un fork o si otro worker ya rotó el archivo
+        if self._fd is not None and self._pid == os.getpid():
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._pid = os.getpid()
+
+    def _rotate(self):
+        try:
+            # Si otro worker ya lo rotó, `path` es un archivo nuevo que no hay que pisar
+            if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                os.replace(self.path, self.path + ".1")
+        except FileNotFoundError:
+            pass
+        os.close(self._fd)
+        self._fd = None
+
+    def latest(self, limit=100):
+        """Las últimas `limit`, de la más nueva a la más vieja (del archivo si hay uno)"""
+        if self.path is None or not os.path.exists(self.path):
+            with self._lock:
+                return list(reversed(self._letters))[:limit]
+        lines = tail_lines(self.path, limit)
+        if len(lines) < limit:
+            lines = tail_lines(self.path + ".1", limit - len(lines)) + lines
+        return [json.loads(line) for line in reversed(lines)]
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                os.close(self._fd)
+            self._fd = None
+
+
+class HandlerPool:
+    """Executor propio de un tipo de notificación con un límite de trabajos pendientes.
+
+    `kind` es "thread" o "process" (para handlers que usan mucha CPU; el
+    handler y la notificación tienen que poder serializarse con pickle). El
+    executor se crea con el primer trabajo, así cada worker de gunicorn tiene
+    el suyo.
+    """
+
+    def __init__(self, name, workers=4, kind="thread", max_pending=None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Tipo de pool desconocido: {kind}")
+        self.name = name
+        self.workers = workers
+        self.kind = kind
+        self.max_pending = max_pending or workers * 100
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                if self.kind == "process":
+                    self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix=f"handler-{self.name}"
+                    )
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, fn, *args, slot_timeout=None):
+        """Devuelve el future del trabajo; lanza HandlerPoolFullError si no hay lugar.
+
+        Con `slot_timeout` espera hasta ese tiempo a que se libere un lugar.
+        """
+        acquired = self._slots.acquire(timeout=slot_timeout) if slot_timeout else self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise HandlerPoolFullError(f"Pool de handlers '{self.name}' lleno")
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.pending += 1
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        # El lugar se libera cuando el handler termina de verdad, aunque ya haya vencido
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def record(self, result):
+        with self._lock:
+            if result == "ok":
+                self.completed += 1
+            elif result == "timeout":
+                self.timed_out += 1
+            else:
+                self.failed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=wait)
+
+
+class _Route:
+    __slots__ = ("handler", "notification_type", "action", "timeout")
+
+    def __init__(self, handler, notification_type, action, timeout):
+        self.handler = handler
+        self.notification_type = notification_type
+        self.action = action
+        self.timeout = timeout
+
+    @property
+    def name(self):
+        return getattr(self.handler, "__name__", repr(self.handler))
+
+
+class _Job:
+    """Ejecución de un handler: se resuelve una sola vez (terminó, falló o venció)"""
+
+    __slots__ = ("route", "notification", "future", "started", "settled", "result", "error")
+
+    def __init__(self, route, notification):
+        self.route = route
+        self.notification = notification
+        self.future = None
+        self.started = time.perf_counter()
+        self.settled = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Dispatcher:
+    """Registro de handlers por tipo (y acción) de notificación.
+
+    Cada tipo corre en su propio HandlerPool, así un handler lento de un tipo
+    no frena a los demás. Cada handler tiene un tiempo máximo: si falla, vence
+    o su pool está lleno, la notificación va al DeadLetterStore. `observer`,
+    si se pasa, recibe (tipo, resultado, segundos) de cada ejecución.
+    """
+
+    def __init__(self, dead_letters, default_workers=4, default_timeout=30, pool_config=None, observer=None):
+        self.dead_letters = dead_letters
+        self.default_workers = default_workers
+        self.default_timeout = default_timeout
+        # tipo -> (workers, kind)
+        self.pool_config = pool_config or {}
+        self.observer = observer
+        self._routes = {}
+        self._pools = {}
+        self._lock = threading.Lock()
+        # Vencimientos pendientes: (deadline, n, job)
+        self._deadlines = []
+        self._counter = itertools.count()
+        self._deadline_changed = threading.Condition(self._lock)
+        self._watchdog = None
+
+    def register(self, notification_type, handler, action=None, timeout=None):
+        """Asocia `handler(notification)` al tipo, o sólo a una acción del tipo (p. ej. "payment.updated")"""
+        self._routes[(notification_type, action)] = _Route(
+            handler, notification_type, action, timeout or self.default_timeout
+        )
+
+    def handler(self, notification_type, action=None, timeout=None):
+        """Decorador equivalente a register()"""
+        def decorator(handler):
+            self.register(notification_type, handler, action=action, timeout=timeout)
+            return handler
+        return decorator
+
+    def resolve(self, notification_type, action=None):
+        """Handler para la acción si hay uno específico, si no el del tipo, o None"""
+        return self._routes.get((notification_type, action)) or self._routes.get((notification_type, None))
+
+    def pool(self, notification_type):
+        with self._lock:
+            pool = self._pools.get(notification_type)
+            if pool is None:
+                workers, kind = self.pool_config.get(notification_type, (self.default_workers, "thread"))
+                pool = self._pools[notification_type] = HandlerPool(notification_type, workers=workers, kind=kind)
+            return pool
+
+    def dispatch(self, notification, wait=False, slot_timeout=None):
+        """Ejecuta el handler de la notificación en el pool de su tipo.
+
+        Devuelve "unhandled" si no hay handler registrado. Sin `wait` devuelve
+        "dispatched" apenas encola; con `wait` espera el resultado y relanza el
+        error del handler (que igual queda en el DeadLetterStore). Con
+        `slot_timeout` espera hasta ese tiempo a que el pool tenga lugar antes
+        de rechazar la notificación.
+        """
+        data = notification["data"]
+        route = self.resolve(data.get('type'), data.get('action'))
+        if route is None:
+            return "unhandled"
+        pool = self.pool(route.notification_type)
+        job = _Job(route, notification)
+        try:
+            job.future = pool.submit(route.handler, notification, slot_timeout=slot_timeout)
+        except HandlerPoolFullError as e:
+            self._settle(job, "rejected", e)
+        else:
+            self._watch(job, pool)
+            job.future.add_done_callback(lambda future: self._finished(job, pool))
+        if not wait:
+            return "dispatched"
+        job.settled.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _watch(self, job, pool):
+        with self._lock:
+            heapq.heappush(self._deadlines, (time.monotonic() + job.route.timeout, next(self._counter), job, pool))
+            if self._watchdog is None or self._watchdog[1] != os.getpid():
+                thread = threading.Thread(target=self._watch_loop, name="handler-watchdog", daemon=True)
+                thread.start()
+                self._watchdog = (thread, os.getpid())
+            self._deadline_changed.notify()
+
+    def _watch_loop(self):
+        while True:
+            with self._lock:
+                # Sacar los trabajos que ya terminaron para no esperar de más
+                while self._deadlines and self._deadlines[0][2].settled.is_set():
+                    heapq.heappop(self._deadlines)
+                if not self._deadlines:
+                    self._deadline_changed.wait()
+                    continue
+                deadline, _, job, pool = self._deadlines[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._deadline_changed.wait(remaining)
+                    continue
+                heapq.heappop(self._deadlines)
+            if not job.settled.is_set():
+                pool.record("timeout")
+                self._settle(job, "timeout", HandlerTimeoutError(
+                    f"El handler {job.route.name} no terminó en {job.route.timeout} s"
+                ))
+
+    def _finished(self, job, pool):
+        error = job.future.exception()
+        result = "ok" if error is None else "error"
+        if job.settled.is_set():
+            # Ya se había dado por vencido; sólo se deja constancia
+            logging.warning("El handler %s terminó después de vencer (%s)", job.route.name, result)
+            return
+        pool.record(result)
+        self._settle(job, result, error)
+
+    def _settle(self, job, result, error=None):
+        with self._lock:
+            if job.settled.is_set():
+                return
+            job.result = result
+            job.error = error
+            job.settled.set()
+        if error is not None:
+            data = job.notification["data"]
+            self.dead_letters.add({
+                "failed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "reason": result,
+                "handler": job.route.name,
+                "error": str(error),
+                "type": data.get('type'),
+                "action": data.get('action'),
+                "timestamp": job.notification.get("timestamp"),
+                "request_id": job.notification.get("request_id"),
+                "data": data,
+                "headers": job.notification.get("headers"),
+            })
+            logging.error(
+                "Handler %s (%s): %s", job.route.name, result, error,
+                extra={"request_id": job.notification.get("request_id"), "notification_type": data.get('type')},
+            )
+        if self.observer is not None:
+            self.observer(job.route.notification_type, result, time.perf_counter() - job.started)
+
+    def stats(self):
+        with self._lock:
+            pools = dict(self._pools)
+        return {
+            "handlers": sorted(
+                f"{notification_type}:{action}" if action else notification_type
+                for notification_type, action in self._routes
+            ),
+            "pools": {name: pool.stats() for name, pool in pools.items()},
+            "dead_letters": self.dead_letters.total,
+        }
+
+    def shutdown(self, wait=True):
+        """Espera a que terminen los handlers en curso y cierra los pools"""
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.shutdown(wait=wait)
+        self.dead_letters.close()
+
+
+def parse_pool_config(spec):
+    """Lee "transfer=2,report=1:process" como {"transfer": (2, "thread"), "report": (1, "process")}"""
+    config = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        notification_type, _, value = item.strip().partition("=")
+        workers, _, kind = value.partition(":")
+        config[notification_type] = (int(workers), kind or "thread")
+    return config
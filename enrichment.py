@@ -0,0 +1,329 @@
+import http.client
+import json
+import os
+import random
+import ssl
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+# Campos del pago en la API de Mercado Pago -> campos que se guardan y muestran
+PAYMENT_FIELDS = {
+    "amount": "transaction_amount",
+    "currency": "currency_id",
+    "status": "status",
+    "status_detail": "status_detail",
+    "description": "description",
+    "date_last_updated": "date_last_updated",
+}
+
+
+class EnrichmentError(Exception):
+    """No se pudo obtener el recurso desde la API de Mercado Pago"""
+
+
+class ResourceNotFoundError(EnrichmentError):
+    """La API respondió 404 para el recurso pedido"""
+
+
+class CircuitOpenError(EnrichmentError):
+    """El circuito está abierto: la API viene fallando y no se la consulta por un tiempo"""
+
+
+class ConnectionPool:
+    """Conexiones HTTP keep-alive reutilizables hacia un mismo host.
+
+    Guarda hasta `size` conexiones libres; si todas están ocupadas abre otra y
+    la descarta al devolverla. Después de un fork no se reutilizan las
+    conexiones heredadas del proceso padre.
+    """
+
+    def __init__(self, base_url, size=10, timeout=5):
+        target = urllib.parse.urlsplit(base_url)
+        self.host = target.hostname
+        self.port = target.port
+        self.https = target.scheme == "https"
+        self.base_path = target.path.rstrip("/")
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._ssl_context = ssl.create_default_context() if self.https else None
+
+    def _new_connection(self):
+        if self.https:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle = []
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.size and self._pid == os.getpid():
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, path, headers):
+        """Hace un request y devuelve (status, header Retry-After, cuerpo)"""
+        conn, reused = self._acquire()
+        try:
+            conn.request(method, self.base_path + path, headers=headers)
+            response = conn.getresponse()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            if not reused:
+                raise
+            # El servidor pudo haber cerrado la conexión inactiva: un intento con una nueva
+            conn = self._new_connection()
+            try:
+                conn.request(method, self.base_path + path, headers=headers)
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                raise
+        try:
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        return response.status, response.getheader("Retry-After"), body
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class TTLCache:
+    """Caché LRU de capacidad fija donde cada valor vence a los `ttl` segundos"""
+
+    def __init__(self, capacity=10000, ttl=60):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class CircuitBreaker:
+    """Corta las consultas después de `failure_threshold` fallas seguidas.
+
+    Con el circuito abierto las llamadas fallan al instante durante
+    `reset_timeout` segundos; después se deja pasar una sola de prueba y según
+    su resultado el circuito se cierra o vuelve a abrirse.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        """Lanza CircuitOpenError si no se debe consultar la API ahora"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._trial or time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("API de Mercado Pago no disponible (circuito abierto)")
+            self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self._opened_at is not None or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class _Call:
+    """Consulta en curso que comparten los hilos que piden el mismo recurso"""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MercadoPagoClient:
+    """Cliente de la API de Mercado Pago para completar las notificaciones.
+
+    Usa un pool de conexiones persistentes, guarda los pagos consultados en una
+    caché TTL/LRU y, si varios hilos piden el mismo pago a la vez, hace una sola
+    consulta y comparte el resultado. Los errores transitorios (conexión, 429,
+    5xx) se reintentan con backoff exponencial con jitter, y un circuit breaker
+    deja de consultar la API mientras sigue fallando.
+    """
+
+    def __init__(self, access_token, base_url="https://api.mercadopago.com", timeout=5, pool_size=10,
+                 retries=2, backoff=0.2, max_backoff=5, cache_ttl=60, cache_size=10000,
+                 failure_threshold=5, reset_timeout=30):
+        self._pool = ConnectionPool(base_url, size=pool_size, timeout=timeout)
+        self._headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Accept": "application/json",
+            "Connection": "keep-alive",
+        }
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache = TTLCache(capacity=cache_size, ttl=cache_ttl)
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.coalesced = 0
+        self.requests = 0
+        self.errors = 0
+
+    def get_payment(self, payment_id, refresh=False):
+        """Datos del pago (ver PAYMENT_FIELDS); con `refresh` no se usa lo que haya en caché"""
+        key = str(payment_id)
+        if not refresh:
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self._lock:
+                    self.cache_hits += 1
+                return cached
+        with self._lock:
+            self.cache_misses += 1
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            body = self._fetch(f"/v1/payments/{urllib.parse.quote(key, safe='')}")
+            call.result = {field: body.get(source) for field, source in PAYMENT_FIELDS.items()}
+            self.cache.put(key, call.result)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+    def _sleep_before_retry(self, attempt, retry_after):
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, min(self.max_backoff, float(retry_after)))
+            except ValueError:
+                pass
+        time.sleep(delay)
+
+    def _fetch(self, path):
+        self.breaker.before_call()
+        error = None
+        retry_after = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._sleep_before_retry(attempt - 1, retry_after)
+            with self._lock:
+                self.requests += 1
+            try:
+                status, retry_after, body = self._pool.request("GET", path, self._headers)
+            except (OSError, http.client.HTTPException) as e:
+                error = EnrichmentError(f"Error de conexión con la API de Mercado Pago: {str(e)}")
+                retry_after = None
+                continue
+            if status == 200:
+                self.breaker.record_success()
+                try:
+                    return json.loads(body)
+                except ValueError:
+                    raise EnrichmentError("Respuesta inválida de la API de Mercado Pago")
+            if status == 429 or status >= 500:
+                error = EnrichmentError(f"La API de Mercado Pago respondió {status}")
+                continue
+            # Los demás errores (404, 401...) son del pedido, no de la disponibilidad de la API
+            self.breaker.record_success()
+            if status == 404:
+                raise ResourceNotFoundError(f"Recurso no encontrado: {path}")
+            raise EnrichmentError(f"La API de Mercado Pago respondió {status}")
+        with self._lock:
+            self.errors += 1
+        self.breaker.record_failure()
+        raise error
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cache_size": len(self.cache),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "coalesced": self.coalesced,
+                "requests": self.requests,
+                "errors": self.errors,
+                "circuit": self.breaker.state,
+            }
+
+    def close(self):
+        self._pool.close()
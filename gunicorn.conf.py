@@ -0,0 +1,55 @@
+# Configuración de gunicorn para producción:
+#   gunicorn -c gunicorn.conf.py server:app
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# gevent (por defecto): cada request y cada cliente de /webhook/stream es un
+# greenlet, así un worker sostiene cientos de monitores abiertos (hasta
+# SSE_MAX_CLIENTS) sin un hilo por cliente. Los handlers que usan mucha CPU
+# frenan a los demás greenlets del worker: conviene darles un pool ":process"
+# (WEBHOOK_HANDLER_POOLS).
+# gthread: hilos por proceso; cada cliente de /webhook/stream retiene un hilo, así
+# que se admiten threads // 4 clientes por worker (2 con 8 hilos) y los demás
+# reciben 503 (SSE_MAX_CLIENTS lo cambia)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+if worker_class == "gevent":
+    # Con preload_app la app se importa en el master antes de crear los workers:
+    # hay que parchear antes para que sus locks y colas ya sean de gevent
+    from gevent import monkey
+    monkey.patch_all()
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# Cargar la app en el master antes del fork: los workers arrancan rápido y
+# comparten por copy-on-write el historial reconstruido desde el log
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# Mercado Pago reutiliza conexiones; el keep-alive debe superar al del balanceador
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 75))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+# Tiempo para terminar los requests en curso y vaciar la cola al apagar
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def pre_fork(server, worker):
+    # Cada worker recibe un número estable (0..workers-1) que se reutiliza cuando
+    # se reemplaza un worker; con él se separan los archivos que escribe cada uno
+    used = {getattr(w, "slot", None) for w in server.WORKERS.values()}
+    worker.slot = next(slot for slot in range(len(used) + 1) if slot not in used)
+
+
+def post_fork(server, worker):
+    import server as webhook_server
+    webhook_server.init_worker(worker.slot, server.num_workers, server.cfg.worker_class_str, server.cfg.threads)
+
+
+def worker_exit(server, worker):
+    # Procesar lo que quedó en la cola y bajar el log a disco antes de salir
+    import server as webhook_server
+    webhook_server.shutdown(graceful_timeout)
@@ -0,0 +1,396 @@
+import bisect
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import payloads
+
+# Secuencias que se copian del índice por cada vez que se toma el lock
+CANDIDATES_CHUNK = 256
+
+
+def resource_id(data):
+    """Id del recurso notificado (`data.id`) como texto, o None si no viene"""
+    resource = data.get('data')
+    value = resource.get('id') if isinstance(resource, dict) else None
+    return str(value) if value is not None else None
+
+
+class NotificationEntry:
+    """Notificación guardada en el historial"""
+
+    __slots__ = (
+        "seq", "timestamp", "data", "headers", "resource", "raw", "received_at", "notification_type", "notification_id",
+    )
+
+    def __init__(self, seq, timestamp, data, headers, resource=None, raw=None, received_at=None):
+        self.seq = seq
+        self.timestamp = timestamp
+        # Momento de llegada (epoch): contra él se comparan los filtros de fecha
+        self.received_at = time.time() if received_at is None else received_at
+        self.data = data
+        self.headers = headers
+        # Datos del recurso obtenidos de la API de Mercado Pago (monto, estado...), si se consultó
+        self.resource = resource
+        # Cuerpo original tal como llegó, para guardarlo y mostrarlo sin volver a serializar
+        self.raw = raw
+        self.notification_type = data.get('type')
+        self.notification_id = resource_id(data)
+
+
+class NotificationHistory:
+    """Buffer circular de capacidad fija con las últimas notificaciones.
+
+    Agregar es O(1) sin importar la capacidad. Las lecturas no toman el lock:
+    recorren el buffer desde la más reciente y se detienen en cuanto encuentran
+    un lugar que ya fue pisado por una escritura más nueva. Un índice secundario
+    por tipo y por id guarda los números de secuencia de cada uno, para que los
+    filtros no recorran todo el buffer.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = [None] * capacity
+        self._next_seq = 0
+        self._lock = threading.Lock()
+        # Índices secundarios: tipo / id -> números de secuencia en orden creciente
+        self._by_type = {}
+        self._by_id = {}
+        # Entradas completadas después de agregarlas: (número de actualización, seq)
+        self._updates = deque(maxlen=capacity)
+        self._next_update = 0
+        # Se notifica cada vez que llega o se completa una notificación (para los suscriptores en vivo)
+        self._changed = threading.Condition()
+        # Momento (epoch) de la última notificación agregada
+        self.updated_at = time.time()
+
+    def append(self, timestamp, data, headers, resource=None, raw=None, received_at=None):
+        """Agrega una notificación y devuelve la entrada creada"""
+        with self._lock:
+            seq = self._next_seq
+            entry = NotificationEntry(seq, timestamp, data, headers, resource, raw, received_at)
+            slot = seq % self.capacity
+            evicted = self._buffer[slot]
+            if evicted is not None:
+                self._unindex(evicted)
+            self._buffer[slot] = entry
+            self._by_type.setdefault(entry.notification_type, deque()).append(seq)
+            if entry.notification_id is not None:
+                self._by_id.setdefault(entry.notification_id, deque()).append(seq)
+            # Se publica después de escribir el lugar para que los lectores nunca vean uno vacío
+            self._next_seq = seq + 1
+            self.updated_at = time.time()
+        with self._changed:
+            self._changed.notify_all()
+        return entry
+
+    def set_resource(self, seq, resource):
+        """Agrega a una notificación ya guardada los datos de su recurso obtenidos de la API"""
+        entry = self.get(seq)
+        if entry is None:
+            return False
+        entry.resource = resource
+        with self._lock:
+            self._updates.append((self._next_update, seq))
+            self._next_update += 1
+            self.updated_at = time.time()
+        with self._changed:
+            self._changed.notify_all()
+        return True
+
+    @property
+    def update_version(self):
+        """Número de la próxima actualización de set_resource()"""
+        return self._next_update
+
+    def updates_since(self, number):
+        """Entradas completadas desde la actualización `number`: lista de (número, entrada)"""
+        with self._lock:
+            updates = [update for update in self._updates if update[0] >= number]
+        return [(update_number, entry) for update_number, seq in updates
+                if (entry := self.get(seq)) is not None]
+
+    def _unindex(self, entry):
+        # La entrada que sale siempre es la más vieja de su tipo y de su id
+        for index, key in ((self._by_type, entry.notification_type), (self._by_id, entry.notification_id)):
+            seqs = index.get(key)
+            if seqs and seqs[0] == entry.seq:
+                seqs.popleft()
+                if not seqs:
+                    del index[key]
+
+    def wait_for_change(self, version, timeout=None, update_version=None):
+        """Bloquea hasta que la versión supere `version` (o la de actualizaciones
+        supere `update_version`); devuelve False si venció el tiempo"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._next_seq > version or (
+                update_version is not None and self._next_update > update_version
+            ), timeout)
+
+    @property
+    def version(self):
+        """Número que cambia cada vez que se agrega una notificación"""
+        return self._next_seq
+
+    def __len__(self):
+        return min(self._next_seq, self.capacity)
+
+    def __iter__(self):
+        return self.iter_entries()
+
+    def get(self, seq):
+        """Notificación con ese número de secuencia, o None si ya salió del buffer"""
+        if seq < 0 or seq >= self._next_seq:
+            return None
+        entry = self._buffer[seq % self.capacity]
+        return entry if entry is not None and entry.seq == seq else None
+
+    def _candidates(self, notification_type, notification_id, before=None):
+        """Secuencias candidatas según el índice más selectivo, de la más nueva a la más vieja.
+
+        Se copian de a tandas cortas desde el final (o desde el cursor): el lock
+        se toma sólo para cada tanda y nunca para copiar el índice entero.
+        """
+        with self._lock:
+            indexes = []
+            if notification_type is not None:
+                indexes.append(self._by_type.get(notification_type, ()))
+            if notification_id is not None:
+                indexes.append(self._by_id.get(str(notification_id), ()))
+            seqs = min(indexes, key=len)
+        upper = self._next_seq if before is None else before
+        while True:
+            with self._lock:
+                end = bisect.bisect_left(seqs, upper)
+                chunk = [seqs[i] for i in range(end - 1, max(0, end - CANDIDATES_CHUNK) - 1, -1)]
+            if not chunk:
+                return
+            yield from chunk
+            upper = chunk[-1]
+
+    def iter_entries(self, notification_type=None, notification_id=None, action=None,
+                     since=None, until=None, before=None, limit=None):
+        """Recorre las notificaciones de la más reciente a la más antigua, con filtros opcionales.
+
+        `since`/`until` son epoch y se comparan contra el momento de llegada;
+        `before` limita a secuencias menores (cursor de paginación).
+        """
+        if notification_type is not None or notification_id is not None:
+            seqs = self._candidates(notification_type, notification_id, before)
+        else:
+            head = self._next_seq if before is None else max(0, min(before, self._next_seq))
+            seqs = range(head - 1, max(0, self._next_seq - self.capacity) - 1, -1)
+        found = 0
+        for seq in seqs:
+            entry = self._buffer[seq % self.capacity]
+            # Si un escritor ya reemplazó este lugar, todo lo que sigue es todavía más viejo
+            if entry is None or entry.seq != seq:
+                return
+            if notification_type is not None and entry.notification_type != notification_type:
+                continue
+            if notification_id is not None and entry.notification_id != str(notification_id):
+                continue
+            if action is not None and entry.data.get('action') != action:
+                continue
+            if since is not None and entry.received_at < since:
+                continue
+            if until is not None and entry.received_at > until:
+                continue
+            yield entry
+            found += 1
+            if limit is not None and found >= limit:
+                return
+
+    def latest(self, limit):
+        """Lista con las últimas `limit` notificaciones"""
+        return list(self.iter_entries(limit=limit))
+
+    def since(self, seq):
+        """Notificaciones con número de secuencia mayor a `seq`, de la más vieja a la más nueva"""
+        entries = []
+        for entry in self.iter_entries():
+            if entry.seq <= seq:
+                break
+            entries.append(entry)
+        entries.reverse()
+        return entries
+
+
+class SqliteHistory:
+    """Historial compartido entre procesos, guardado en un archivo SQLite en modo WAL.
+
+    Ofrece la misma interfaz que NotificationHistory para usarlo cuando gunicorn
+    corre varios workers: todos leen y escriben el mismo historial. Cada hilo
+    usa su propia conexión, que se vuelve a abrir después de un fork.
+    """
+
+    def __init__(self, path, capacity, poll_interval=0.5):
+        self.path = path
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._changed = threading.Condition()
+        self._appends = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS notifications ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, type TEXT, action TEXT, "
+            "notification_id TEXT, data TEXT NOT NULL, headers TEXT NOT NULL, created REAL NOT NULL, resource TEXT, "
+            "received_at REAL)"
+        )
+        # Bases creadas antes de guardar los datos del recurso o el momento de llegada
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(notifications)")}
+        if "resource" not in columns:
+            conn.execute("ALTER TABLE notifications ADD COLUMN resource TEXT")
+        if "received_at" not in columns:
+            conn.execute("ALTER TABLE notifications ADD COLUMN received_at REAL")
+            conn.execute("UPDATE notifications SET received_at = created")
+        conn.execute("CREATE INDEX IF NOT EXISTS notifications_type ON notifications (type, seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS notifications_id ON notifications (notification_id, seq)")
+        # Entradas completadas después de agregarlas, para avisar a los suscriptores de todos los workers
+        conn.execute("CREATE TABLE IF NOT EXISTS notification_updates (id INTEGER PRIMARY KEY AUTOINCREMENT, seq INTEGER)")
+        conn.execute("DROP INDEX IF EXISTS notifications_timestamp")
+        conn.execute("CREATE INDEX IF NOT EXISTS notifications_received_at ON notifications (received_at)")
+        self._started_at = time.time()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _entry(row):
+        seq, timestamp, data, headers, resource, received_at = row
+        return NotificationEntry(
+            seq, timestamp, payloads.loads(data), payloads.loads(headers),
+            payloads.loads(resource) if resource else None, data.encode("utf-8"), received_at,
+        )
+
+    def append(self, timestamp, data, headers, resource=None, raw=None, received_at=None):
+        conn = self._connection()
+        entry = NotificationEntry(None, timestamp, data, headers, resource, raw, received_at)
+        cursor = conn.execute(
+            "INSERT INTO notifications (timestamp, type, action, notification_id, data, headers, created, resource, "
+            "received_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (timestamp, entry.notification_type, data.get('action'), entry.notification_id,
+             # El cuerpo original se guarda tal cual; sólo se serializa si no se tiene
+             raw.decode("utf-8") if raw is not None else payloads.dumps(data).decode("utf-8"),
+             payloads.dumps(headers).decode("utf-8"), time.time(),
+             payloads.dumps(resource).decode("utf-8") if resource is not None else None, entry.received_at),
+        )
+        entry.seq = cursor.lastrowid
+        # Recortar de a tandas para no pagar un DELETE por notificación
+        self._appends += 1
+        if self._appends % 100 == 0:
+            conn.execute("DELETE FROM notifications WHERE seq <= ?", (entry.seq - self.capacity,))
+        with self._changed:
+            self._changed.notify_all()
+        return entry
+
+    def set_resource(self, seq, resource):
+        # `created` pasa a ser el momento de la última escritura de la fila: así
+        # updated_at cambia y las vistas cacheadas se vuelven a armar
+        conn = self._connection()
+        cursor = conn.execute(
+            "UPDATE notifications SET resource = ?, created = ? WHERE seq = ?",
+            (payloads.dumps(resource).decode("utf-8"), time.time(), seq),
+        )
+        if cursor.rowcount == 0:
+            return False
+        update_id = conn.execute("INSERT INTO notification_updates (seq) VALUES (?)", (seq,)).lastrowid
+        if update_id % 100 == 0:
+            conn.execute("DELETE FROM notification_updates WHERE id <= ?", (update_id - self.capacity,))
+        with self._changed:
+            self._changed.notify_all()
+        return True
+
+    @property
+    def update_version(self):
+        row = self._connection().execute("SELECT max(id) FROM notification_updates").fetchone()
+        return (row[0] or 0) + 1
+
+    def updates_since(self, number):
+        rows = self._connection().execute(
+            "SELECT u.id, n.seq, n.timestamp, n.data, n.headers, n.resource, n.received_at "
+            "FROM notification_updates u JOIN notifications n ON n.seq = u.seq WHERE u.id >= ? ORDER BY u.id",
+            (number,),
+        ).fetchall()
+        return [(row[0], self._entry(row[1:])) for row in rows]
+
+    @property
+    def version(self):
+        row = self._connection().execute("SELECT max(seq) FROM notifications").fetchone()
+        return (row[0] or 0) + 1
+
+    @property
+    def updated_at(self):
+        row = self._connection().execute("SELECT max(created) FROM notifications").fetchone()
+        return row[0] or self._started_at
+
+    def __len__(self):
+        row = self._connection().execute(
+            "SELECT count(*) FROM notifications WHERE seq > ?", (self.version - 1 - self.capacity,)
+        ).fetchone()
+        return row[0]
+
+    def __iter__(self):
+        return self.iter_entries()
+
+    def wait_for_change(self, version, timeout=None, update_version=None):
+        """Como NotificationHistory.wait_for_change, consultando la base para ver lo que escriben otros workers"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.version <= version and (update_version is None or self.update_version <= update_version):
+            remaining = self.poll_interval if deadline is None else min(self.poll_interval, deadline - time.monotonic())
+            if remaining <= 0:
+                return False
+            with self._changed:
+                self._changed.wait(remaining)
+        return True
+
+    def get(self, seq):
+        row = self._connection().execute(
+            "SELECT seq, timestamp, data, headers, resource, received_at FROM notifications WHERE seq = ?", (seq,)
+        ).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def iter_entries(self, notification_type=None, notification_id=None, action=None,
+                     since=None, until=None, before=None, limit=None):
+        conditions = []
+        params = []
+        for column, value, operator in (
+            ("type", notification_type, "="),
+            ("notification_id", str(notification_id) if notification_id is not None else None, "="),
+            ("action", action, "="),
+            ("received_at", since, ">="),
+            ("received_at", until, "<="),
+            ("seq", before, "<"),
+        ):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        query = "SELECT seq, timestamp, data, headers, resource, received_at FROM notifications"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY seq DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        for row in self._connection().execute(query, params):
+            yield self._entry(row)
+
+    def latest(self, limit):
+        return list(self.iter_entries(limit=limit))
+
+    def since(self, seq):
+        rows = self._connection().execute(
+            "SELECT seq, timestamp, data, headers, resource, received_at FROM notifications WHERE seq > ? ORDER BY seq",
+            (seq,),
+        ).fetchall()
+        return [self._entry(row) for row in rows]
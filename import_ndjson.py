@@ -0,0 +1,109 @@
+"""Reinyecta notificaciones desde un archivo NDJSON (una notificación JSON por línea).
+
+El archivo se lee de a una línea y se envía en tandas, sin cargarlo entero en
+memoria. Cada item pasa por la misma deduplicación y procesamiento que /webhook:
+
+    python import_ndjson.py export.ndjson --url http://127.0.0.1:8080 --token $WEBHOOK_BATCH_TOKEN
+    python import_ndjson.py export.ndjson --local
+    cat export.ndjson | python import_ndjson.py - --local
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import sys
+import time
+import urllib.parse
+
+
+def read_chunks(stream, chunk_lines):
+    """Tandas de (número de línea, bytes) leyendo el archivo de a una línea"""
+    numbered = ((line_number, line.strip()) for line_number, line in enumerate(stream, 1))
+    non_empty = ((line_number, line) for line_number, line in numbered if line)
+    while True:
+        chunk = list(itertools.islice(non_empty, chunk_lines))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_remote(chunks, url, token):
+    """Envía cada tanda a /webhook/batch reutilizando una conexión keep-alive"""
+    target = urllib.parse.urlsplit(url)
+    connection_class = http.client.HTTPSConnection if target.scheme == "https" else http.client.HTTPConnection
+    connection = connection_class(target.hostname, target.port, timeout=300)
+    path = target.path.rstrip("/") + "/webhook/batch"
+    headers = {"Content-Type": "application/x-ndjson"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    for chunk in chunks:
+        body = b"\n".join(line for _, line in chunk) + b"\n"
+        connection.request("POST", path, body=body, headers=headers)
+        response = connection.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"/webhook/batch respondió {response.status}: {response.read()[:200]!r}")
+        line_numbers = [line_number for line_number, _ in chunk]
+        for raw in response:
+            result = json.loads(raw)
+            if "summary" in result:
+                continue
+            # El servidor numera las líneas de cada tanda desde 1; se traducen a líneas del archivo
+            result["line"] = line_numbers[result["line"] - 1]
+            yield result
+    connection.close()
+
+
+def import_local(chunks):
+    """Procesa las tandas en este proceso (escribe en el log/historial configurados por entorno)"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+
+    headers = {"X-Import": "import_ndjson"}
+    try:
+        for chunk in chunks:
+            yield from server.ingest_batch(chunk, headers)
+    finally:
+        # Vaciar la cola y bajar el log a disco antes de salir
+        server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa notificaciones de Mercado Pago desde NDJSON")
+    parser.add_argument("file", help="archivo NDJSON o - para leer de stdin")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="servidor al que enviar las tandas por /webhook/batch")
+    target.add_argument("--local", action="store_true", help="procesar en este proceso, sin HTTP")
+    parser.add_argument("--token", default=os.environ.get("WEBHOOK_BATCH_TOKEN"), help="token de /webhook/batch")
+    parser.add_argument("--chunk-lines", type=int, default=1000, help="líneas por tanda")
+    args = parser.parse_args(argv)
+
+    stream = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+    started = time.monotonic()
+    totals = {}
+    try:
+        chunks = read_chunks(stream, args.chunk_lines)
+        results = import_local(chunks) if args.local else import_remote(chunks, args.url, args.token)
+        for result in results:
+            totals[result["status"]] = totals.get(result["status"], 0) + 1
+            if result["status"] == "error":
+                print(f"línea {result['line']}: {result.get('error')}", file=sys.stderr)
+    except (OSError, RuntimeError, http.client.HTTPException) as e:
+        print(f"Error importando: {str(e)}", file=sys.stderr)
+        return 2
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+    elapsed = time.monotonic() - started
+    processed = sum(totals.values())
+    print(json.dumps({
+        "items": processed,
+        "results": totals,
+        "elapsed_s": round(elapsed, 2),
+        "items_per_s": round(processed / elapsed, 1) if elapsed else None,
+    }))
+    return 1 if totals.get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
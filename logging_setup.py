@@ -0,0 +1,214 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# Contexto del request en curso que se agrega a cada línea de log
+request_id_var = contextvars.ContextVar("request_id", default=None)
+notification_type_var = contextvars.ContextVar("notification_type", default=None)
+
+# Atributos estándar de LogRecord que no se copian como campos extra
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "rate_key"}
+
+
+class Preview:
+    """Vista previa acotada de un documento JSON, calculada recién al formatear el log.
+
+    Recorre la estructura escribiendo hasta `limit` caracteres, sin serializar
+    el documento completo para después truncarlo.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=100):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        parts = []
+        remaining = [self.limit]
+
+        def write(text):
+            if remaining[0] <= 0:
+                return False
+            parts.append(text[:remaining[0]])
+            remaining[0] -= len(text)
+            return remaining[0] > 0
+
+        def walk(value):
+            if isinstance(value, dict):
+                if not write("{"):
+                    return False
+                for i, (key, item) in enumerate(value.items()):
+                    if (i and not write(", ")) or not write(json.dumps(str(key)) + ": ") or not walk(item):
+                        return False
+                return write("}")
+            if isinstance(value, (list, tuple)):
+                if not write("["):
+                    return False
+                for i, item in enumerate(value):
+                    if (i and not write(", ")) or not walk(item):
+                        return False
+                return write("]")
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                return write(bytes(value[:remaining[0]]).decode("utf-8", errors="replace"))
+            if isinstance(value, str):
+                return write(json.dumps(value[:remaining[0]]))
+            return write(json.dumps(value, default=str))
+
+        complete = walk(self.value)
+        text = "".join(parts)
+        return text if complete else text + "..."
+
+
+class ContextFilter(logging.Filter):
+    """Agrega el id de request y el tipo de notificación del contexto actual"""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        if not hasattr(record, "notification_type"):
+            record.notification_type = notification_type_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Limita los mensajes con `extra={"rate_key": ...}` a `rate` por segundo por clave (token bucket).
+
+    Los mensajes descartados se cuentan y el próximo que pasa lleva el total en `suppressed`.
+    """
+
+    def __init__(self, rate=10, burst=50, max_keys=1000):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "rate_key", None)
+        if key is None or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                return False
+            bucket[0] = tokens - 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por mensaje"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(message)s")
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloquea el hilo del request.
+
+    El mensaje se formatea en el hilo del listener (los argumentos viajan sin
+    formatear) y si la cola está llena el mensaje se descarta y se cuenta.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        # Las trazas no se pueden pasar a otro hilo de forma segura: se formatean acá
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _LoggingState:
+    handler = None
+    listener = None
+    output = None
+
+
+def _start_listener(queue_size):
+    log_queue = queue.Queue(maxsize=queue_size)
+    _LoggingState.handler.queue = log_queue
+    _LoggingState.listener = logging.handlers.QueueListener(log_queue, _LoggingState.output, respect_handler_level=True)
+    _LoggingState.listener.start()
+
+
+def stop_logging():
+    """Escribe lo que quedó en la cola y detiene el hilo del listener"""
+    if _LoggingState.listener is not None:
+        _LoggingState.listener.stop()
+        _LoggingState.listener = None
+
+
+def dropped_messages():
+    return _LoggingState.handler.dropped if _LoggingState.handler is not None else 0
+
+
+def configure_logging(level="INFO", fmt="json", queue_size=10000, rate=10, burst=50):
+    """Configura el logging raíz con una cola acotada y un hilo que escribe en stderr"""
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    handler = AsyncQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(ContextFilter())
+    handler.addFilter(RateLimitFilter(rate=rate, burst=burst))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _LoggingState.handler = handler
+    _LoggingState.output = output
+    _start_listener(queue_size)
+    atexit.register(stop_logging)
+    # El hilo del listener no sobrevive al fork de gunicorn: cada worker arranca el suyo
+    # con una cola nueva (la heredada podría haber quedado con su lock tomado)
+    os.register_at_fork(after_in_child=lambda: _start_listener(queue_size))
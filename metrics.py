@@ -0,0 +1,202 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Límites de los buckets de latencia al estilo HDR: 4 sub-buckets por potencia de 2,
+# desde 1 µs hasta ~67 s, con error relativo acotado (~19%) en todo el rango
+LATENCY_BOUNDS = [1e-6 * 2 ** (i / 4) for i in range(4 * 26 + 1)]
+# Sólo se exponen las potencias de 2 para no inflar la salida de /metrics
+EXPORTED_BOUNDS = LATENCY_BOUNDS[::4]
+
+
+class _Shard:
+    """Acumuladores de un solo hilo: sólo ese hilo escribe, así que no necesita lock"""
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Contadores e histogramas con acumulación por hilo que se combinan al hacer scrape.
+
+    Registrar un valor es una búsqueda en un diccionario del propio hilo (sin
+    locks), así que se puede dejar siempre activo en el camino caliente. Con
+    `directory`, cada proceso escribe periódicamente su total en un archivo y
+    el scrape suma los de todos los workers.
+    """
+
+    def __init__(self, directory=None, process_name=None, flush_interval=5):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._descriptions = {}
+        self.directory = directory
+        self.process_name = process_name
+        self.flush_interval = flush_interval
+        self._flusher = None
+
+    def describe(self, name, kind, help_text):
+        self._descriptions[name] = (kind, help_text)
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=()):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [[0] * (len(LATENCY_BOUNDS) + 1), 0.0, 0]
+        histogram[0][bisect.bisect_left(LATENCY_BOUNDS, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+    def snapshot(self):
+        """Total de este proceso combinando los acumuladores de todos los hilos"""
+        counters = {}
+        histograms = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, value in dict(shard.counters).items():
+                counters[key] = counters.get(key, 0) + value
+            for key, (buckets, total, count) in dict(shard.histograms).items():
+                merged = histograms.get(key)
+                if merged is None:
+                    merged = histograms[key] = [[0] * len(buckets), 0.0, 0]
+                merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                merged[1] += total
+                merged[2] += count
+        return counters, histograms
+
+    def start(self):
+        """Inicia el hilo que publica el total del proceso para los demás workers"""
+        if self.directory is None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+            self._flusher.start()
+
+    def _path(self, process_name):
+        return os.path.join(self.directory, f"{process_name}.json")
+
+    def flush(self):
+        counters, histograms = self.snapshot()
+        data = {
+            "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+            "histograms": [[name, labels, value] for (name, labels), value in histograms.items()],
+        }
+        path = self._path(self.process_name)
+        # Escritura atómica para que un scrape nunca lea un archivo a medias
+        with open(path + ".tmp", "w", encoding="utf-8") as metrics_file:
+            json.dump(data, metrics_file)
+        os.replace(path + ".tmp", path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _other_processes(self):
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        own = f"{self.process_name}.json"
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or name == own:
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as metrics_file:
+                    yield json.load(metrics_file)
+            except (OSError, ValueError):
+                continue
+
+    def collect(self):
+        """Totales de todos los procesos (este en vivo, los demás desde su último archivo)"""
+        counters, histograms = self.snapshot()
+        for data in self._other_processes():
+            for name, labels, value in data["counters"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, (buckets, total, count) in data["histograms"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = [list(buckets), total, count]
+                else:
+                    merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                    merged[1] += total
+                    merged[2] += count
+        return counters, histograms
+
+    def render(self, gauges=()):
+        """Texto en formato de exposición de Prometheus.
+
+        `gauges` es una lista de (nombre, ayuda, labels, valor) medidos al momento del scrape.
+        """
+        counters, histograms = self.collect()
+        lines = []
+        described = set()
+
+        def header(name, kind, help_text):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter", self._descriptions.get(name, ("counter", name))[1])
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            header(name, "histogram", self._descriptions.get(name, ("histogram", name))[1])
+            cumulative = 0
+            position = 0
+            for bound in EXPORTED_BOUNDS:
+                # Sumar los sub-buckets HDR hasta este límite exportado
+                while position < len(LATENCY_BOUNDS) and LATENCY_BOUNDS[position] <= bound:
+                    cumulative += buckets[position]
+                    position += 1
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', f'{bound:.6g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name, help_text, labels, value in gauges:
+            header(name, "gauge", help_text)
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
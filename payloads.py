@@ -0,0 +1,103 @@
+import json
+
+# Decodificadores opcionales más rápidos; sin ellos se usa el módulo json estándar
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+elif msgspec is not None:
+    JSON_BACKEND = "msgspec"
+    _decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder(enc_hook=str)
+else:
+    JSON_BACKEND = "json"
+
+
+def loads(raw):
+    """Decodifica JSON desde bytes o texto; lanza ValueError si no es válido"""
+    if JSON_BACKEND == "orjson":
+        return orjson.loads(raw)
+    if JSON_BACKEND == "msgspec":
+        try:
+            return _decoder.decode(raw)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+    return json.loads(raw)
+
+
+def dumps(value):
+    """Codifica a JSON (bytes UTF-8)"""
+    if JSON_BACKEND == "orjson":
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+    if JSON_BACKEND == "msgspec":
+        return _encoder.encode(value)
+    return json.dumps(value, default=str, ensure_ascii=False).encode("utf-8")
+
+
+class InvalidPayloadError(ValueError):
+    """El cuerpo no es una notificación de Mercado Pago válida"""
+
+
+# Campos conocidos de una notificación de Mercado Pago y los tipos que pueden tener
+NOTIFICATION_SCHEMA = {
+    "id": (int, str),
+    "type": (str,),
+    "action": (str,),
+    "api_version": (str,),
+    "date_created": (str,),
+    "live_mode": (bool,),
+    "user_id": (int, str),
+    "data": (dict,),
+}
+# Campos conocidos de `data`
+DATA_SCHEMA = {
+    "id": (int, str),
+}
+# Tipos que Mercado Pago siempre envía con `data.id`
+TYPES_WITH_RESOURCE = {
+    "payment",
+    "merchant_order",
+    "chargebacks",
+    "subscription_preapproval",
+    "subscription_preapproval_plan",
+    "subscription_authorized_payment",
+    "point_integration_wh",
+}
+
+
+def _check_fields(document, schema, prefix=""):
+    for field, types in schema.items():
+        value = document.get(field)
+        # bool es subclase de int: no se acepta como id
+        if value is not None and (not isinstance(value, types) or (isinstance(value, bool) and bool not in types)):
+            raise InvalidPayloadError(f"Campo '{prefix}{field}' inválido")
+
+
+def validate_notification(data):
+    """Verifica los tipos de los campos conocidos; los campos desconocidos se aceptan tal cual"""
+    if not isinstance(data, dict) or not data:
+        raise InvalidPayloadError("Datos JSON no encontrados")
+    _check_fields(data, NOTIFICATION_SCHEMA)
+    resource = data.get("data")
+    if resource is not None:
+        _check_fields(resource, DATA_SCHEMA, "data.")
+    if data.get("type") in TYPES_WITH_RESOURCE and (resource is None or resource.get("id") in (None, "")):
+        raise InvalidPayloadError("Falta 'data.id'")
+    return data
+
+
+def parse_notification(raw):
+    """Decodifica y valida el cuerpo crudo de una notificación en una sola pasada"""
+    try:
+        data = loads(raw)
+    except ValueError:
+        raise InvalidPayloadError("JSON inválido")
+    return validate_notification(data)
@@ -0,0 +1,104 @@
+import logging
+import queue
+import threading
+
+# Marca que indica a un hilo del pool que debe terminar
+_STOP = object()
+
+
+class QueueFullError(Exception):
+    """La cola de procesamiento alcanzó su capacidad máxima"""
+
+
+class ProcessingQueue:
+    """Cola acotada en memoria con un pool de hilos que procesa las notificaciones.
+
+    El endpoint sólo encola la notificación y responde; los hilos ejecutan
+    `handler` para cada elemento en segundo plano.
+    """
+
+    def __init__(self, handler, maxsize=1000, workers=4):
+        self._handler = handler
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._workers = workers
+        self._threads = []
+        self._lock = threading.Lock()
+        self.maxsize = maxsize
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        """Inicia los hilos del pool (una sola vez por proceso)"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self._workers):
+                thread = threading.Thread(
+                    target=self._run, name=f"webhook-worker-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, item, timeout=None):
+        """Encola un elemento; lanza QueueFullError si no hay lugar.
+
+        Sin `timeout` no bloquea; con `timeout` espera hasta ese tiempo a que se libere lugar.
+        """
+        # Los hilos se crean de forma perezosa para que cada worker de gunicorn
+        # tenga los suyos aunque la app se cargue antes del fork
+        if not self._threads:
+            self.start()
+        try:
+            if timeout is None:
+                self._queue.put_nowait(item)
+            else:
+                self._queue.put(item, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError("Cola de procesamiento llena")
+        with self._lock:
+            self.enqueued += 1
+
+    def stop(self, timeout=None):
+        """Procesa lo que queda en la cola y detiene los hilos"""
+        with self._lock:
+            threads = list(self._threads)
+            self._threads = []
+        # Las marcas quedan detrás de los elementos pendientes, así que la cola se vacía antes de salir
+        for _ in threads:
+            self._queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": self._queue.qsize(),
+                "maxsize": self.maxsize,
+                "workers": len(self._threads),
+                "enqueued": self.enqueued,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed,
+            }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            try:
+                self._handler(item)
+            except Exception as e:
+                logging.error("Error procesando notificación en segundo plano: %s", e)
+                with self._lock:
+                    self.failed += 1
+            else:
+                with self._lock:
+                    self.processed += 1
@@ -0,0 +1,64 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+def retry_after_header(wait):
+    """Valor del header Retry-After (segundos enteros) para una espera"""
+    return str(max(1, math.ceil(wait)))
+
+
+class TokenBucketLimiter:
+    """Token bucket por clave (IP de origen o clave de firma).
+
+    Cada clave guarda sólo [tokens, último uso], así que decidir cuesta una
+    búsqueda en un diccionario. Las claves se mantienen en orden de uso y, al
+    superar `max_keys`, se descarta la que lleva más tiempo inactiva: un
+    atacante que rota IPs no puede hacer crecer la memoria.
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def allow(self, key, now=None):
+        """Consume un token de `key`; devuelve 0 si se permite o los segundos a esperar si no"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return 0
+            self.rejected += 1
+            return (1 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "keys": len(self._buckets),
+                "allowed": self.allowed,
+                "rejected": self.rejected,
+                "evicted": self.evicted,
+            }
@@ -1,92 +1,884 @@
-from flask import Flask, request, render_template_string, jsonify
+from flask import Flask, Response, g, request, jsonify, make_response, stream_with_context
+import atexit
 import json
 import logging
-import hmac
 import hashlib
+import hmac
 import os
+import time
+import uuid
 from datetime import datetime
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from broadcast import NotificationBroadcaster, TooManySubscribersError
+from dedup import DedupIndex, SqliteDedupBackend, notification_key
+from dispatch import DeadLetterStore, Dispatcher, parse_pool_config
+from enrichment import CircuitOpenError, EnrichmentError, MercadoPagoClient, ResourceNotFoundError
+from history import NotificationHistory, SqliteHistory, resource_id
+from logging_setup import Preview, configure_logging, dropped_messages, notification_type_var, request_id_var
+from metrics import MetricsRegistry
+from payloads import JSON_BACKEND, InvalidPayloadError, parse_notification
+from processing import ProcessingQueue, QueueFullError
+from ratelimit import TokenBucketLimiter, retry_after_header
+from signature import InvalidSignatureError, SignatureVerifier, parse_signature_header
+from status import StatusStore, event_time
+from storage import WORKER_DIR_PREFIX, NotificationLog, replay_directory
 
 app = Flask(__name__)
-logging.basicConfig(level=logging.INFO)
+# Proxies delante de la app (nginx, balanceador) cuyo X-Forwarded-For se acepta para obtener la IP de origen
+TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+# Logging: los mensajes se encolan y un hilo aparte los escribe en stderr ("json" o "text")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# Mensajes por segundo por tipo de notificación para los logs ruidosos (0 = sin límite)
+LOG_RATE_LIMIT = float(os.environ.get("LOG_RATE_LIMIT", 10))
+LOG_RATE_BURST = int(os.environ.get("LOG_RATE_BURST", 50))
+configure_logging(
+    level=LOG_LEVEL,
+    fmt=LOG_FORMAT,
+    queue_size=LOG_QUEUE_SIZE,
+    rate=LOG_RATE_LIMIT,
+    burst=LOG_RATE_BURST,
+)
 
 # Secreto compartido con Mercado Pago (deberías obtenerlo de variables de entorno)
 MP_SECRET = os.environ.get("MP_WEBHOOK_SECRET", "tu_clave_secreta")
+# Claves activas separadas por coma, para rotar el secreto sin cortar el servicio
+MP_SECRETS = [secret.strip() for secret in os.environ.get("MP_WEBHOOK_SECRETS", MP_SECRET).split(",") if secret.strip()]
+# Verificación del header x-signature (activar en producción)
+MP_VERIFY_SIGNATURE = os.environ.get("MP_VERIFY_SIGNATURE", "0") == "1"
+# Antigüedad máxima aceptada para el timestamp de la firma, en segundos
+MP_SIGNATURE_TOLERANCE = int(os.environ.get("MP_SIGNATURE_TOLERANCE", 300))
 
-# Lista para almacenar las últimas notificaciones recibidas (en memoria)
+# Buffer circular con las últimas notificaciones recibidas (en memoria)
 # En producción deberías usar una base de datos
-notifications_history = []
-MAX_HISTORY = 10
-
-def verify_webhook_signature(request_data, signature, secret):
-    """Verifica la firma del webhook de Mercado Pago"""
-    if not signature:
-        return False
-    
-    calculated_signature = hmac.new(
-        secret.encode('utf-8'),
-        request_data,
-        hashlib.sha256
-    ).hexdigest()
-    
-    return hmac.compare_digest(calculated_signature, signature)
+MAX_HISTORY = int(os.environ.get("MAX_HISTORY", 10000))
+# Cantidad de notificaciones que se muestran en /webhook/view
+VIEW_LIMIT = int(os.environ.get("WEBHOOK_VIEW_LIMIT", 100))
+# Con varios workers de gunicorn el historial se comparte a través de un archivo SQLite
+HISTORY_DB_PATH = os.environ.get("HISTORY_DB_PATH")
+if HISTORY_DB_PATH:
+    notifications_history = SqliteHistory(HISTORY_DB_PATH, MAX_HISTORY)
+else:
+    notifications_history = NotificationHistory(MAX_HISTORY)
+
+# Modo de procesamiento: "sync" procesa dentro de la petición, "async" encola y responde de inmediato
+PROCESSING_MODE = os.environ.get("WEBHOOK_PROCESSING_MODE", "sync")
+QUEUE_MAXSIZE = int(os.environ.get("WEBHOOK_QUEUE_SIZE", 1000))
+QUEUE_WORKERS = int(os.environ.get("WEBHOOK_QUEUE_WORKERS", 4))
+
+# Deduplicación de reintentos de Mercado Pago (id + tipo + acción)
+DEDUP_TTL = int(os.environ.get("DEDUP_TTL", 86400))
+DEDUP_MAX_KEYS = int(os.environ.get("DEDUP_MAX_KEYS", 1_000_000))
+# Archivo SQLite opcional para conservar el índice entre reinicios y compartirlo entre workers
+DEDUP_DB_PATH = os.environ.get("DEDUP_DB_PATH")
+dedup_index = DedupIndex(
+    ttl=DEDUP_TTL,
+    max_keys=DEDUP_MAX_KEYS,
+    backend=SqliteDedupBackend(DEDUP_DB_PATH) if DEDUP_DB_PATH else None,
+)
+
+# Directorio del log durable de notificaciones (si no se define, el historial vive sólo en memoria)
+NOTIFICATION_LOG_DIR = os.environ.get("NOTIFICATION_LOG_DIR")
+NOTIFICATION_LOG_SEGMENT_MB = int(os.environ.get("NOTIFICATION_LOG_SEGMENT_MB", 64))
+NOTIFICATION_LOG_MAX_SEGMENTS = int(os.environ.get("NOTIFICATION_LOG_MAX_SEGMENTS", 16))
+# Si está activo, /webhook responde recién cuando la notificación quedó en disco
+NOTIFICATION_LOG_DURABLE = os.environ.get("NOTIFICATION_LOG_DURABLE", "0") == "1"
+
+def open_notification_log(directory):
+    log = NotificationLog(
+        directory,
+        segment_bytes=NOTIFICATION_LOG_SEGMENT_MB * 1024 * 1024,
+        max_segments=NOTIFICATION_LOG_MAX_SEGMENTS,
+    )
+    atexit.register(log.close)
+    return log
+
+notification_log = None
+if NOTIFICATION_LOG_DIR:
+    notification_log = open_notification_log(NOTIFICATION_LOG_DIR)
+
+# Reconstruir el historial en memoria a partir del log (también lo escrito por cada worker)
+if NOTIFICATION_LOG_DIR and not HISTORY_DB_PATH:
+    for record in replay_directory(NOTIFICATION_LOG_DIR):
+        try:
+            notifications_history.append(
+                datetime.fromtimestamp(record.timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+                record.json(),
+                record.headers,
+                raw=record.body,
+                received_at=record.timestamp,
+            )
+        except ValueError:
+            logging.warning("Registro inválido en el log de notificaciones: segmento %s, offset %s", record.segment, record.offset)
+
+# Último estado de cada pago/transferencia, para consultarlo sin recorrer el historial
+STATUS_DB_PATH = os.environ.get("STATUS_DB_PATH")
+# Estados que el hilo escritor guarda por transacción y cuánto espera para juntar una tanda
+STATUS_BATCH_SIZE = int(os.environ.get("STATUS_BATCH_SIZE", 500))
+STATUS_FLUSH_INTERVAL = float(os.environ.get("STATUS_FLUSH_INTERVAL", 0.2))
+status_store = None
+if STATUS_DB_PATH:
+    status_store = StatusStore(STATUS_DB_PATH, batch_size=STATUS_BATCH_SIZE, flush_interval=STATUS_FLUSH_INTERVAL)
+
+# Protección de /webhook: tamaño máximo del cuerpo y límite de pedidos por origen
+WEBHOOK_MAX_BODY = int(os.environ.get("WEBHOOK_MAX_BODY", 64 * 1024))
+# Pedidos por segundo y ráfaga por IP de origen; con varios workers el límite es por worker.
+# Desactivado por defecto (0): Mercado Pago envía desde pocas IPs y un límite
+# mal calculado rechazaría notificaciones legítimas. Detrás de un proxy hace
+# falta TRUSTED_PROXIES para que cada origen tenga su propio bucket
+WEBHOOK_RATE_LIMIT = float(os.environ.get("WEBHOOK_RATE_LIMIT", 0))
+WEBHOOK_RATE_BURST = int(os.environ.get("WEBHOOK_RATE_BURST", 200))
+# Orígenes recordados; los inactivos se descartan primero
+WEBHOOK_RATE_LIMIT_KEYS = int(os.environ.get("WEBHOOK_RATE_LIMIT_KEYS", 10000))
+rate_limiter = None
+if WEBHOOK_RATE_LIMIT > 0:
+    rate_limiter = TokenBucketLimiter(WEBHOOK_RATE_LIMIT, WEBHOOK_RATE_BURST, max_keys=WEBHOOK_RATE_LIMIT_KEYS)
+
+# Los pares (x-request-id, ts) ya aceptados se recuerdan mientras la firma sigue vigente
+signature_verifier = SignatureVerifier(
+    MP_SECRETS,
+    tolerance=MP_SIGNATURE_TOLERANCE,
+    replay_index=DedupIndex(ttl=2 * MP_SIGNATURE_TOLERANCE, resolution=1),
+)
+
+# Métricas del camino caliente, expuestas en /metrics
+# Con varios workers, cada uno publica sus totales en METRICS_DIR y el scrape los suma
+METRICS_DIR = os.environ.get("METRICS_DIR")
+metrics = MetricsRegistry(directory=METRICS_DIR, process_name=f"pid-{os.getpid()}")
+metrics.describe("webhook_requests_total", "counter", "Notificaciones recibidas por tipo y código de respuesta")
+metrics.describe("webhook_request_duration_seconds", "histogram", "Latencia de /webhook por tipo de notificación")
+metrics.describe("webhook_stage_duration_seconds", "histogram", "Tiempo de cada etapa de /webhook")
+metrics.describe("webhook_processed_total", "counter", "Notificaciones procesadas por tipo y resultado")
+metrics.describe("webhook_processing_duration_seconds", "histogram", "Tiempo de procesamiento por tipo de notificación")
+metrics.describe("webhook_rejected_total", "counter", "Pedidos a /webhook rechazados antes de leer el cuerpo, por motivo")
+metrics.describe("webhook_handler_total", "counter", "Ejecuciones de handlers por tipo y resultado")
+metrics.describe("webhook_handler_duration_seconds", "histogram", "Tiempo de los handlers por tipo de notificación")
+metrics.describe("mp_api_lookups_total", "counter", "Consultas de pagos a la API de Mercado Pago por resultado")
+metrics.describe("mp_api_lookup_duration_seconds", "histogram", "Tiempo de las consultas de pagos (incluye caché y reintentos)")
+
+# Tipos con label propio en las métricas; el resto se agrupa para acotar la cardinalidad
+METRIC_TYPES = {"payment", "transfer", "merchant_order", "subscription_preapproval", "chargebacks"}
+
+def metric_type(notification_type):
+    return notification_type if notification_type in METRIC_TYPES else "other"
+
+def observe_stage(stage, started):
+    """Registra la duración de una etapa de /webhook y devuelve el instante actual"""
+    now = time.perf_counter()
+    metrics.observe("webhook_stage_duration_seconds", now - started, (("stage", stage),))
+    return now
+
+# Consulta de los pagos a la API de Mercado Pago (sólo si hay un access token configurado)
+MP_ACCESS_TOKEN = os.environ.get("MP_ACCESS_TOKEN")
+# Se puede apuntar a un servidor local de prueba, por ejemplo http://127.0.0.1:9000
+MP_API_URL = os.environ.get("MP_API_URL", "https://api.mercadopago.com")
+MP_API_TIMEOUT = float(os.environ.get("MP_API_TIMEOUT", 5))
+MP_API_POOL_SIZE = int(os.environ.get("MP_API_POOL_SIZE", 10))
+MP_API_RETRIES = int(os.environ.get("MP_API_RETRIES", 2))
+MP_PAYMENT_CACHE_TTL = int(os.environ.get("MP_PAYMENT_CACHE_TTL", 60))
+MP_PAYMENT_CACHE_SIZE = int(os.environ.get("MP_PAYMENT_CACHE_SIZE", 10000))
+# Fallas seguidas que abren el circuito y segundos que queda abierto
+MP_API_BREAKER_FAILURES = int(os.environ.get("MP_API_BREAKER_FAILURES", 5))
+MP_API_BREAKER_RESET = int(os.environ.get("MP_API_BREAKER_RESET", 30))
+
+payment_client = None
+if MP_ACCESS_TOKEN:
+    payment_client = MercadoPagoClient(
+        MP_ACCESS_TOKEN,
+        base_url=MP_API_URL,
+        timeout=MP_API_TIMEOUT,
+        pool_size=MP_API_POOL_SIZE,
+        retries=MP_API_RETRIES,
+        cache_ttl=MP_PAYMENT_CACHE_TTL,
+        cache_size=MP_PAYMENT_CACHE_SIZE,
+        failure_threshold=MP_API_BREAKER_FAILURES,
+        reset_timeout=MP_API_BREAKER_RESET,
+    )
+
+def fetch_payment(data, log_context):
+    """Datos del pago notificado según la API, o None si no se pudieron obtener"""
+    payment_id = resource_id(data)
+    if payment_client is None or payment_id is None:
+        return None
+    started = time.perf_counter()
+    result = "ok"
+    try:
+        # Una actualización cambia el estado del pago: no sirve lo que haya en caché
+        return payment_client.get_payment(payment_id, refresh=data.get('action') == 'payment.updated')
+    except ResourceNotFoundError:
+        result = "not_found"
+        logging.warning("Pago %s no encontrado en la API de Mercado Pago", payment_id, extra=log_context)
+    except CircuitOpenError:
+        result = "circuit_open"
+    except EnrichmentError as e:
+        result = "error"
+        logging.warning("No se pudo consultar el pago %s: %s", payment_id, e, extra=log_context)
+    finally:
+        metrics.inc("mp_api_lookups_total", (("result", result),))
+        metrics.observe("mp_api_lookup_duration_seconds", time.perf_counter() - started)
+    return None
+
+# Handlers por tipo de notificación: cada tipo tiene su propio pool de hilos
+WEBHOOK_HANDLER_WORKERS = int(os.environ.get("WEBHOOK_HANDLER_WORKERS", 4))
+# Pools distintos por tipo, p. ej. "transfer=2,report=1:process" (":process" para handlers que usan mucha CPU)
+WEBHOOK_HANDLER_POOLS = parse_pool_config(os.environ.get("WEBHOOK_HANDLER_POOLS", ""))
+# Segundos que puede tardar un handler antes de darlo por fallido
+WEBHOOK_HANDLER_TIMEOUT = float(os.environ.get("WEBHOOK_HANDLER_TIMEOUT", 30))
+# En modo "async", segundos que un hilo de la cola espera lugar en el pool del
+# tipo antes de mandar la notificación a dead letters. Mientras espera la cola
+# se llena y /webhook responde 503, así Mercado Pago reintenta más tarde
+WEBHOOK_HANDLER_SLOT_WAIT = float(os.environ.get("WEBHOOK_HANDLER_SLOT_WAIT", 60))
+# Notificaciones cuyo handler falló (se guardan también en este archivo NDJSON si se configura)
+DEAD_LETTER_PATH = os.environ.get("DEAD_LETTER_PATH")
+DEAD_LETTER_CAPACITY = int(os.environ.get("DEAD_LETTER_CAPACITY", 1000))
+# Tamaño al que se rota el archivo de dead letters (se conserva el anterior como .1)
+DEAD_LETTER_MAX_BYTES = int(os.environ.get("DEAD_LETTER_MAX_MB", 16)) * 1024 * 1024
+
+def observe_handler(notification_type, result, seconds):
+    labels = (("type", metric_type(notification_type)),)
+    metrics.inc("webhook_handler_total", labels + (("result", result),))
+    metrics.observe("webhook_handler_duration_seconds", seconds, labels)
+
+dispatcher = Dispatcher(
+    DeadLetterStore(capacity=DEAD_LETTER_CAPACITY, path=DEAD_LETTER_PATH, max_bytes=DEAD_LETTER_MAX_BYTES),
+    default_workers=WEBHOOK_HANDLER_WORKERS,
+    default_timeout=WEBHOOK_HANDLER_TIMEOUT,
+    pool_config=WEBHOOK_HANDLER_POOLS,
+    observer=observe_handler,
+)
+
+def notification_log_context(notification_entry):
+    # Los hilos de la cola y de los handlers no ven el contexto del request: se pasa explícito
+    notification_type = notification_entry["data"].get('type')
+    return {
+        "request_id": notification_entry.get("request_id"),
+        "notification_type": notification_type,
+        "rate_key": notification_type,
+    }
+
+def process_notification(notification_entry):
+    """Procesa una notificación registrando su duración y resultado"""
+    started = time.perf_counter()
+    labels = (("type", metric_type(notification_entry["data"].get('type'))),)
+    try:
+        handle_notification(notification_entry)
+    except Exception:
+        metrics.inc("webhook_processed_total", labels + (("result", "error"),))
+        raise
+    metrics.inc("webhook_processed_total", labels + (("result", "ok"),))
+    metrics.observe("webhook_processing_duration_seconds", time.perf_counter() - started, labels)
+
+# Tipos cuyo handler registra el estado en el índice (después de consultar la API)
+STATUS_FROM_HANDLER = {"payment"}
+
+def handle_notification(notification_entry):
+    """Guarda la notificación en el historial y la pasa al handler de su tipo"""
+    data = notification_entry["data"]
+    log_context = notification_log_context(notification_entry)
+
+    # Registrar la notificación recibida (la vista previa se arma sólo si el mensaje se escribe)
+    logging.info("Webhook recibido: %s", Preview(notification_entry.get("raw") or data), extra=log_context)
+
+    # Guardar la notificación en el historial (las más viejas se descartan solas)
+    entry = notifications_history.append(
+        notification_entry["timestamp"], data, notification_entry["headers"],
+        raw=notification_entry.get("raw"), received_at=notification_entry.get("received_at"),
+    )
+    # Los pagos escriben su estado una sola vez en handle_payment, ya con los
+    # datos de la API: una fila previa sin estado tendría un event_time más
+    # nuevo que el del pago y la actualización completa se descartaría
+    notification_type = data.get('type')
+    if status_store is not None and notification_type not in STATUS_FROM_HANDLER:
+        record_status(notification_entry, None)
+
+    # Procesar según el tipo de notificación, en el pool de ese tipo. En modo
+    # "sync" se espera al handler para responder; en "async" sólo se espera
+    # lugar en el pool, así un pool lleno frena a la cola en lugar de descartar
+    notification_entry["seq"] = entry.seq
+    if PROCESSING_MODE == "async":
+        result = dispatcher.dispatch(notification_entry, slot_timeout=WEBHOOK_HANDLER_SLOT_WAIT)
+    else:
+        result = dispatcher.dispatch(notification_entry, wait=True)
+    if result == "unhandled":
+        logging.info("Sin handler para la notificación de tipo %s", notification_type, extra=log_context)
+        metrics.inc("webhook_handler_total", (("type", metric_type(notification_type)), ("result", "unhandled")))
+
+def record_status(notification_entry, payment):
+    """Encola el estado del recurso notificado para el índice de estados"""
+    data = notification_entry["data"]
+    notification_id = resource_id(data)
+    if notification_id is None:
+        return
+    resource = data.get('data') if isinstance(data.get('data'), dict) else {}
+    if payment:
+        resource = {**resource, **{key: value for key, value in payment.items() if value is not None}}
+    amount = resource.get('amount')
+    status_store.record(
+        data.get('type'),
+        notification_id,
+        # El orden lo da el momento del evento, no el de llegada
+        event_time(resource.get('date_last_updated'), data.get('date_created'), notification_entry.get("received_at")),
+        status=resource.get('status'),
+        status_detail=resource.get('status_detail'),
+        amount=amount if isinstance(amount, (int, float)) and not isinstance(amount, bool) else None,
+        currency=resource.get('currency'),
+        description=resource.get('description'),
+        action=data.get('action'),
+    )
+
+@dispatcher.handler("payment")
+def handle_payment(notification_entry):
+    """Procesa un pago"""
+    payment_data = notification_entry["data"].get('data', {})
+    # Los datos del pago se consultan acá, en el pool de pagos, para que una API
+    # lenta no ocupe los hilos de los requests ni los de la cola compartida.
+    # Después se completan la entrada del historial y el índice de estados
+    # (con un pool ":process" la entrada en memoria es la del proceso hijo)
+    payment = fetch_payment(notification_entry["data"], notification_log_context(notification_entry))
+    if payment is not None:
+        notification_entry["resource"] = payment
+        notifications_history.set_resource(notification_entry["seq"], payment)
+    if status_store is not None:
+        # Sin datos de la API se guarda lo que trae la notificación
+        record_status(notification_entry, payment)
+    # Aquí implementarías tu lógica de negocio para procesar el pago
+    logging.info(
+        "Pago procesado: ID %s, estado %s", payment_data.get('id'),
+        payment["status"] if payment else "desconocido", extra=notification_log_context(notification_entry),
+    )
+
+@dispatcher.handler("transfer")
+def handle_transfer(notification_entry):
+    """Procesa una transferencia"""
+    transfer_data = notification_entry["data"].get('data', {})
+    # Aquí implementarías tu lógica para procesar la transferencia
+    logging.info(
+        "Transferencia procesada: ID %s", transfer_data.get('id'), extra=notification_log_context(notification_entry)
+    )
+
+# Cola acotada para el modo "async"; los hilos se inician con la primera notificación
+processing_queue = ProcessingQueue(process_notification, maxsize=QUEUE_MAXSIZE, workers=QUEUE_WORKERS)
+
+def new_notification_entry(data, headers, received_at, raw=None):
+    return {
+        "timestamp": datetime.fromtimestamp(received_at).strftime("%Y-%m-%d %H:%M:%S"),
+        "data": data,
+        "raw": raw,
+        "headers": headers,
+        "received_at": received_at,
+        "request_id": request_id_var.get(),
+    }
+
+def dispatch_notification(notification_entry, timeout=None):
+    """Procesa la notificación o la encola según el modo; devuelve "success" o "accepted".
+
+    En modo "async" lanza QueueFullError si la cola sigue llena después de `timeout`.
+    """
+    if PROCESSING_MODE == "async":
+        processing_queue.submit(notification_entry, timeout=timeout)
+        return "accepted"
+    process_notification(notification_entry)
+    return "success"
+
+@app.before_request
+def bind_request_context():
+    """Asocia el id del request (el de Mercado Pago si viene) a los logs de este request"""
+    request_id_var.set(request.headers.get('X-Request-Id') or uuid.uuid4().hex)
+    notification_type_var.set(None)
 
 @app.route("/webhook", methods=["POST"])
 def webhook():
+    started = time.perf_counter()
+    g.metric_type = "other"
+    response = make_response(receive_webhook())
+    labels = (("type", g.metric_type),)
+    metrics.observe("webhook_request_duration_seconds", time.perf_counter() - started, labels)
+    metrics.inc("webhook_requests_total", labels + (("status", str(response.status_code)),))
+    return response
+
+# Respuestas de rechazo ya serializadas: rechazar no debe costar más que aceptar
+REJECTIONS = {
+    "rate_limited": (429, b'{"error":"Demasiados pedidos"}\n'),
+    "missing_signature": (403, b'{"error":"Falta la firma"}\n'),
+    "length_required": (411, b'{"error":"Falta Content-Length"}\n'),
+    "too_large": (413, b'{"error":"Cuerpo demasiado grande"}\n'),
+}
+
+def reject(reason, retry_after=None):
+    status, body = REJECTIONS[reason]
+    metrics.inc("webhook_rejected_total", (("reason", reason),))
+    response = Response(body, status, mimetype="application/json")
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return response
+
+def guard_webhook():
+    """Controles baratos antes de verificar la firma y leer el cuerpo; devuelve el rechazo o None"""
+    if rate_limiter is not None:
+        wait = rate_limiter.allow(request.remote_addr)
+        if wait:
+            return reject("rate_limited", retry_after_header(wait))
+    if MP_VERIFY_SIGNATURE:
+        # El header se separa una sola vez: la verificación usa estos mismos valores
+        g.signature = parse_signature_header(request.headers.get('X-Signature', ''))
+        if not all(g.signature):
+            return reject("missing_signature")
+    content_length = request.content_length
+    if content_length is None:
+        return reject("length_required")
+    if content_length > WEBHOOK_MAX_BODY:
+        return reject("too_large")
+    return None
+
+def receive_webhook():
+    stage_started = time.perf_counter()
+    # Clave registrada en el índice de duplicados; se olvida si la notificación no se llega a aceptar
+    registered_key = None
     try:
-        # Obtener los datos crudos y la firma
-        request_data = request.get_data()
-        signature = request.headers.get('X-Signature')
+        rejection = guard_webhook()
+        if rejection is not None:
+            return rejection
         
-        # Verificar la firma (esto dependerá de cómo Mercado Pago implementa la verificación)
-        # Nota: Ajusta esto según la documentación específica de Mercado Pago
-        # if not verify_webhook_signature(request_data, signature, MP_SECRET):
-        #     logging.warning("Firma de webhook inválida")
-        #     return jsonify({"error": "Firma inválida"}), 403
+        # Verificar la firma antes de leer el cuerpo: x-signature + x-request-id + data.id de la URL
+        if MP_VERIFY_SIGNATURE:
+            try:
+                signature_verifier.verify_parsed(
+                    *g.signature,
+                    request.headers.get('X-Request-Id'),
+                    request.args.get('data.id'),
+                )
+            except InvalidSignatureError as e:
+                logging.warning("Firma de webhook inválida: %s", e, extra={"rate_key": "invalid_signature"})
+                return jsonify({"error": "Firma inválida"}), 403
+            stage_started = observe_stage("verify", stage_started)
         
-        # Obtener los datos JSON
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "Datos JSON no encontrados"}), 400
-            
-        # Registrar la notificación recibida
-        logging.info(f"Webhook recibido: {json.dumps(data)[:100]}...")
+        # Obtener los datos crudos y decodificarlos una sola vez; los bytes
+        # originales se reutilizan para el log, el historial y el monitor
+        request_data = request.get_data()
+        try:
+            data = parse_notification(request_data)
+        except InvalidPayloadError as e:
+            return jsonify({"error": str(e)}), 400
+        g.metric_type = metric_type(data.get('type'))
+        notification_type_var.set(data.get('type'))
+        stage_started = observe_stage("parse", stage_started)
         
-        # Guardar la notificación en el historial
-        notification_entry = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "data": data,
-            "headers": dict(request.headers)
-        }
-        notifications_history.insert(0, notification_entry)
+        # Los reintentos de una notificación ya recibida no se vuelven a procesar
+        key = notification_key(data)
+        duplicate = key is not None and dedup_index.seen(key)
+        stage_started = observe_stage("dedup", stage_started)
+        if duplicate:
+            logging.info("Notificación duplicada ignorada: %s", key, extra={"rate_key": data.get('type')})
+            return jsonify({"status": "duplicate", "message": "Notificación duplicada ignorada"})
+        registered_key = key
+        
+        received_at = time.time()
+        notification_entry = new_notification_entry(data, dict(request.headers), received_at, raw=request_data)
         
-        # Mantener solo las últimas MAX_HISTORY notificaciones
-        if len(notifications_history) > MAX_HISTORY:
-            notifications_history.pop()
+        # Persistir la notificación cruda antes de procesarla
+        if notification_log is not None:
+            notification_log.append(
+                request_data,
+                notification_entry["headers"],
+                timestamp=received_at,
+                notification_id=resource_id(data),
+                durable=NOTIFICATION_LOG_DURABLE,
+            )
+            stage_started = observe_stage("store", stage_started)
         
-        # Procesar según el tipo de notificación
-        notification_type = data.get('type')
-        if notification_type == 'payment':
-            # Procesar un pago
-            payment_data = data.get('data', {})
-            # Aquí implementarías tu lógica de negocio para procesar el pago
-            logging.info(f"Pago procesado: ID {payment_data.get('id')}")
-        elif notification_type == 'transfer':
-            # Procesar una transferencia
-            transfer_data = data.get('data', {})
-            # Aquí implementarías tu lógica para procesar la transferencia
-            logging.info(f"Transferencia procesada: ID {transfer_data.get('id')}")
+        try:
+            status = dispatch_notification(notification_entry)
+        except QueueFullError:
+            # Si la cola está llena pedimos a Mercado Pago que reintente
+            logging.warning("Cola de procesamiento llena, notificación rechazada")
+            if registered_key is not None:
+                dedup_index.forget(registered_key)
+            return jsonify({"error": "Cola de procesamiento llena"}), 503, {"Retry-After": "1"}
+        if status == "accepted":
+            observe_stage("enqueue", stage_started)
+            return jsonify({"status": "accepted", "message": "Notificación encolada para procesamiento"})
+        observe_stage("process", stage_started)
         
         # Devolver respuesta de éxito
         return jsonify({"status": "success", "message": "Notificación procesada correctamente"})
         
     except Exception as e:
-        logging.error(f"Error procesando webhook: {str(e)}")
+        logging.error("Error procesando webhook: %s", e)
+        # Mercado Pago va a reintentar: el reintento no debe contarse como duplicado
+        if registered_key is not None:
+            dedup_index.forget(registered_key)
         return jsonify({"error": str(e)}), 500
 
-@app.route("/webhook/view", methods=["GET"])
-def webhook_view():
-    """Página para visualizar las notificaciones recibidas en tarjetas simples"""
-    return render_template_string("""
+# Ingesta por lotes (NDJSON) para reinyectar notificaciones perdidas
+BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", 500))
+# Token requerido en "Authorization: Bearer ..." para usar /webhook/batch
+BATCH_TOKEN = os.environ.get("WEBHOOK_BATCH_TOKEN")
+# Headers del lote que no se guardan con las notificaciones: el historial y el
+# log se pueden leer sin autenticación y no deben exponer credenciales
+CREDENTIAL_HEADERS = {"authorization", "proxy-authorization", "cookie", "x-api-key"}
+# Cuánto espera un lote a que se libere lugar en la cola antes de rechazar un item
+BATCH_QUEUE_TIMEOUT = int(os.environ.get("WEBHOOK_BATCH_QUEUE_TIMEOUT", 30))
+metrics.describe("webhook_batch_items_total", "counter", "Items recibidos por /webhook/batch por resultado")
+
+def iter_ndjson(stream):
+    """(número de línea, bytes) de cada línea no vacía, leyendo el stream de a una línea"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if line:
+            yield line_number, line
+
+def ingest_batch(lines, headers):
+    """Procesa un lote de líneas NDJSON por el mismo camino que /webhook.
+
+    La deduplicación es por item, el log se escribe en una sola operación para
+    todo el lote y se devuelve un resultado por línea, en orden.
+    """
+    received_at = time.time()
+    results = {}
+    fresh = []
+    for line_number, raw in lines:
+        try:
+            data = parse_notification(raw)
+        except InvalidPayloadError as e:
+            results[line_number] = {"line": line_number, "status": "error", "error": str(e)}
+            continue
+        key = notification_key(data)
+        if key is not None and dedup_index.seen(key):
+            results[line_number] = {"line": line_number, "status": "duplicate"}
+            continue
+        fresh.append((line_number, raw, data, key))
+
+    if notification_log is not None and fresh:
+        try:
+            notification_log.append_many(
+                [(raw, headers, received_at, resource_id(data)) for _, raw, data, _ in fresh],
+                durable=NOTIFICATION_LOG_DURABLE,
+            )
+        except Exception:
+            # Nada del lote quedó aceptado: al reintentar no deben aparecer como duplicados
+            for _, _, _, key in fresh:
+                if key is not None:
+                    dedup_index.forget(key)
+            raise
+
+    for line_number, raw, data, key in fresh:
+        try:
+            status = dispatch_notification(new_notification_entry(data, headers, received_at, raw=raw), timeout=BATCH_QUEUE_TIMEOUT)
+            results[line_number] = {"line": line_number, "status": status}
+            continue
+        except QueueFullError:
+            results[line_number] = {"line": line_number, "status": "error", "error": "Cola de procesamiento llena"}
+        except Exception as e:
+            results[line_number] = {"line": line_number, "status": "error", "error": str(e)}
+        if key is not None:
+            dedup_index.forget(key)
+
+    ordered = [results[line_number] for line_number in sorted(results)]
+    for result in ordered:
+        metrics.inc("webhook_batch_items_total", (("status", result["status"]),))
+    return ordered
+
+@app.route("/webhook/batch", methods=["POST"])
+def webhook_batch():
+    """Recibe notificaciones en NDJSON (una por línea) y devuelve un resultado por línea en NDJSON"""
+    if BATCH_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode("utf-8"), f"Bearer {BATCH_TOKEN}".encode("utf-8")):
+            return jsonify({"error": "Token inválido"}), 401
+    elif MP_VERIFY_SIGNATURE:
+        # Los lotes no traen firma de Mercado Pago: con la verificación activa hace falta un token
+        return jsonify({"error": "Configurá WEBHOOK_BATCH_TOKEN para usar la ingesta por lotes"}), 403
+
+    headers = {name: value for name, value in request.headers.items() if name.lower() not in CREDENTIAL_HEADERS}
+    headers["X-Import"] = "webhook_batch"
+    stream = request.stream
+
+    def generate():
+        totals = {}
+        batch = []
+        for item in iter_ndjson(stream):
+            batch.append(item)
+            if len(batch) < BATCH_SIZE:
+                continue
+            for result in ingest_batch(batch, headers):
+                totals[result["status"]] = totals.get(result["status"], 0) + 1
+                yield json.dumps(result) + "\n"
+            batch = []
+        if batch:
+            for result in ingest_batch(batch, headers):
+                totals[result["status"]] = totals.get(result["status"], 0) + 1
+                yield json.dumps(result) + "\n"
+        yield json.dumps({"summary": totals}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    queue_stats = processing_queue.stats()
+    gauges = [
+        ("webhook_queue_depth", "Notificaciones esperando en la cola de procesamiento", (), queue_stats["depth"]),
+        ("webhook_queue_capacity", "Capacidad de la cola de procesamiento", (), queue_stats["maxsize"]),
+        ("webhook_history_size", "Notificaciones guardadas en el historial", (), len(notifications_history)),
+        ("webhook_dedup_keys", "Claves en el índice de deduplicación", (), len(dedup_index)),
+        ("webhook_stream_clients", "Clientes conectados a /webhook/stream", (), broadcaster.subscribers),
+        ("webhook_log_dropped_messages", "Mensajes de log descartados por cola llena", (), dropped_messages()),
+    ]
+    for name, pool_stats in dispatcher.stats()["pools"].items():
+        gauges.append(("webhook_handler_pending", "Trabajos pendientes en el pool de handlers de cada tipo",
+                       (("type", name),), pool_stats["pending"]))
+    if rate_limiter is not None:
+        gauges.append(("webhook_rate_limit_keys", "Orígenes con un token bucket activo", (), len(rate_limiter)))
+    if payment_client is not None:
+        gauges.append(("mp_api_payment_cache_size", "Pagos en la caché del cliente de la API", (), len(payment_client.cache)))
+        gauges.append(("mp_api_circuit_open", "1 si el circuito hacia la API de Mercado Pago está abierto", (),
+                       int(payment_client.breaker.state == "open")))
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+@app.route("/webhook/stats", methods=["GET"])
+def webhook_stats():
+    """Métricas básicas de la cola de procesamiento"""
+    return jsonify({
+        "mode": PROCESSING_MODE,
+        "json_backend": JSON_BACKEND,
+        "queue": processing_queue.stats(),
+        "dedup": dedup_index.stats(),
+        "stream_clients": broadcaster.subscribers,
+        "worker": {"pid": os.getpid(), "slot": worker_slot},
+        "history_size": len(notifications_history),
+        "mp_api": payment_client.stats() if payment_client is not None else None,
+        "handlers": dispatcher.stats(),
+        "status_store": status_store.stats() if status_store is not None else None,
+        "rate_limit": rate_limiter.stats() if rate_limiter is not None else None
+    })
+
+@app.route("/webhook/dead-letters", methods=["GET"])
+def webhook_dead_letters():
+    """Últimas notificaciones cuyo handler falló, venció o fue rechazado"""
+    try:
+        limit = min(int(request.args.get("limit", 100)), NOTIFICATIONS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "Parámetro limit inválido"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit debe ser mayor a cero"}), 400
+    return jsonify(dispatcher.dead_letters.latest(limit))
+
+@app.route("/webhook/log/<notification_id>", methods=["GET"])
+def webhook_log(notification_id):
+    """Notificaciones crudas guardadas en el log durable para un id"""
+    if notification_log is None:
+        return jsonify({"error": "Log de notificaciones no configurado"}), 404
+    records = notification_log.get(notification_id)
+    if not records:
+        return jsonify({"error": "Notificación no encontrada"}), 404
+    return jsonify([
+        {
+            "timestamp": datetime.fromtimestamp(record.timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+            "headers": record.headers,
+            "body": record.body.decode("utf-8", errors="replace")
+        }
+        for record in records
+    ])
+
+def notification_summary(entry):
+    """Datos que muestran las tarjetas del monitor para una notificación"""
+    data = entry.data
+    resource = data.get('data') if isinstance(data.get('data'), dict) else {}
+    if entry.resource:
+        # Lo consultado a la API tiene prioridad sobre lo que trae la notificación
+        resource = {**resource, **{key: value for key, value in entry.resource.items() if value is not None}}
+    return {
+        "seq": entry.seq,
+        "timestamp": entry.timestamp,
+        "type": entry.notification_type,
+        "action": data.get('action'),
+        "id": entry.notification_id,
+        "amount": resource.get('amount'),
+        "currency": resource.get('currency'),
+        "status": resource.get('status'),
+        "description": resource.get('description')
+    }
+
+# Paginación de /webhook/notifications
+NOTIFICATIONS_PAGE_SIZE = int(os.environ.get("NOTIFICATIONS_PAGE_SIZE", 50))
+NOTIFICATIONS_MAX_PAGE_SIZE = int(os.environ.get("NOTIFICATIONS_MAX_PAGE_SIZE", 500))
+# Campos que se pueden pedir con ?fields= ("data" y "headers" sólo si se piden)
+SUMMARY_FIELDS = ("seq", "timestamp", "type", "action", "id", "amount", "currency", "status", "description")
+DETAIL_FIELDS = SUMMARY_FIELDS + ("data", "headers")
+
+def project(entry, fields):
+    """Resumen de la notificación reducido a los campos pedidos"""
+    item = notification_summary(entry)
+    item["data"] = entry.data
+    item["headers"] = entry.headers
+    return {field: item[field] for field in fields}
+
+def parse_time(value):
+    """Fecha de un parámetro (epoch o ISO 8601); lanza ValueError si no es válida"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route("/webhook/notifications", methods=["GET"])
+def webhook_notifications():
+    """Historial paginado con filtros por tipo, acción, id y rango de fechas"""
+    args = request.args
+    try:
+        limit = min(int(args.get("limit", NOTIFICATIONS_PAGE_SIZE)), NOTIFICATIONS_MAX_PAGE_SIZE)
+        cursor = int(args["cursor"]) if args.get("cursor") else None
+    except ValueError:
+        return jsonify({"error": "limit y cursor deben ser enteros"}), 400
+    try:
+        since = parse_time(args.get("since"))
+        until = parse_time(args.get("until"))
+    except ValueError:
+        return jsonify({"error": "since y until deben ser epoch o fechas ISO 8601"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit debe ser mayor a cero"}), 400
+    fields = tuple(args["fields"].split(",")) if args.get("fields") else SUMMARY_FIELDS
+    unknown = [field for field in fields if field not in DETAIL_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Campos desconocidos: {', '.join(unknown)}"}), 400
+
+    # Se pide uno de más para saber si hay otra página
+    entries = list(notifications_history.iter_entries(
+        notification_type=args.get("type"),
+        notification_id=args.get("id"),
+        action=args.get("action"),
+        since=since,
+        until=until,
+        before=cursor,
+        limit=limit + 1,
+    ))
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    return jsonify({
+        "items": [project(entry, fields) for entry in entries],
+        # El cursor es la secuencia de la última notificación devuelta
+        "next_cursor": entries[-1].seq if has_more else None
+    })
+
+@app.route("/webhook/notifications/<int:seq>", methods=["GET"])
+def webhook_notification_detail(seq):
+    """Una notificación completa (payload y headers) por su número de secuencia"""
+    entry = notifications_history.get(seq)
+    if entry is None:
+        return jsonify({"error": "Notificación no encontrada"}), 404
+    fields = tuple(request.args["fields"].split(",")) if request.args.get("fields") else DETAIL_FIELDS
+    unknown = [field for field in fields if field not in DETAIL_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Campos desconocidos: {', '.join(unknown)}"}), 400
+    return jsonify(project(entry, fields))
+
+@app.route("/webhook/notifications/<int:seq>/raw", methods=["GET"])
+def webhook_notification_raw(seq):
+    """El cuerpo de la notificación tal como llegó, sin volver a serializarlo"""
+    entry = notifications_history.get(seq)
+    if entry is None:
+        return jsonify({"error": "Notificación no encontrada"}), 404
+    if entry.raw is None:
+        return jsonify(entry.data)
+    return Response(entry.raw, mimetype="application/json")
+
+@app.route("/webhook/status", methods=["GET"])
+def webhook_status_search():
+    """Recursos por tipo, estado y fecha del último evento (?type=&status=&since=&until=&limit=)"""
+    if status_store is None:
+        return jsonify({"error": "Índice de estados no configurado"}), 404
+    try:
+        since = parse_time(request.args.get("since"))
+        until = parse_time(request.args.get("until"))
+        limit = min(int(request.args.get("limit", NOTIFICATIONS_PAGE_SIZE)), NOTIFICATIONS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos"}), 400
+    return jsonify({"items": status_store.find(
+        resource_type=request.args.get("type"),
+        status=request.args.get("status"),
+        since=since,
+        until=until,
+        limit=limit,
+    )})
+
+@app.route("/webhook/status/counts", methods=["GET"])
+def webhook_status_counts():
+    """Cantidad de recursos en cada estado (?type= para un solo tipo)"""
+    if status_store is None:
+        return jsonify({"error": "Índice de estados no configurado"}), 404
+    return jsonify(status_store.counts(request.args.get("type")))
+
+@app.route("/webhook/status/<resource_type>/<resource_id>", methods=["GET"])
+def webhook_status(resource_type, resource_id):
+    """Último estado conocido de un recurso, p. ej. /webhook/status/payment/123"""
+    if status_store is None:
+        return jsonify({"error": "Índice de estados no configurado"}), 404
+    current = status_store.get(resource_type, resource_id)
+    if current is None:
+        return jsonify({"error": "Recurso no encontrado"}), 404
+    return jsonify(current)
+
+# Clientes en vivo del monitor (Server-Sent Events). Con workers gevent (los de
+# gunicorn.conf.py por defecto) un cliente es un greenlet y se admiten 500 por
+# worker. Con gthread o sync cada cliente ocupa un hilo mientras está conectado:
+# si no se configura, el máximo por worker es un cuarto de sus hilos (ver
+# init_worker) para que /webhook siempre tenga hilos libres.
+SSE_MAX_CLIENTS = int(os.environ.get("SSE_MAX_CLIENTS", 500))
+SSE_MAX_CLIENTS_SET = "SSE_MAX_CLIENTS" in os.environ
+# Workers de gunicorn en los que un cliente no ocupa un hilo
+ASYNC_WORKER_CLASSES = {"gevent", "eventlet"}
+SSE_HEARTBEAT = int(os.environ.get("SSE_HEARTBEAT", 15))
+broadcaster = NotificationBroadcaster(
+    notifications_history, notification_summary, max_subscribers=SSE_MAX_CLIENTS, heartbeat=SSE_HEARTBEAT
+)
+
+@app.route("/webhook/stream", methods=["GET"])
+def webhook_stream():
+    """Stream SSE con cada notificación nueva que entra al historial"""
+    # El navegador manda Last-Event-ID al reconectarse; la primera vez viene como parámetro
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id is not None else None
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID inválido"}), 400
+    try:
+        events = broadcaster.subscribe(last_event_id)
+    except TooManySubscribersError:
+        return jsonify({"error": "Demasiados clientes conectados"}), 503, {"Retry-After": "10"}
+    return Response(events, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Evitar que nginx acumule los eventos en su buffer
+        "X-Accel-Buffering": "no"
+    })
+
+# Identificador de este arranque para que los ETag no se repitan entre reinicios
+BOOT_ID = uuid.uuid4().hex[:8]
+
+def history_etag(version, updated_at):
+    """ETag del estado del historial. BOOT_ID se genera antes del fork y lo
+    comparten todos los workers: sin HISTORY_DB_PATH cada worker tiene su
+    propio historial en memoria, así que se agrega el pid para que dos
+    workers no den el mismo ETag a páginas distintas"""
+    prefix = BOOT_ID if HISTORY_DB_PATH else f"{BOOT_ID}-{os.getpid()}"
+    return f"{prefix}-{version}-{int(updated_at * 1000)}"
+
+def conditional_response(body, etag, last_modified):
+    """Respuesta HTML con ETag/Last-Modified; devuelve 304 si el cliente ya la tiene"""
+    response = make_response(body)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # El navegador puede guardarla pero debe revalidar en cada pedido
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+# Plantillas compiladas una sola vez al iniciar y último HTML renderizado del monitor
+WEBHOOK_VIEW_TEMPLATE = app.jinja_env.from_string("""
         <html>
             <head>
                 <title>Monitor de Webhook Mercado Pago</title>
@@ -243,76 +1035,118 @@ def webhook_view():
                         border-radius: 4px;
                         overflow-x: auto;
                     }
+                    .live-status {
+                        font-size: 0.8em;
+                        color: #6c757d;
+                        margin-right: 10px;
+                    }
+                    .live-status.connected {
+                        color: #155724;
+                    }
+                    .status-panel {
+                        background: white;
+                        border-radius: 8px;
+                        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+                        padding: 15px;
+                        margin-bottom: 20px;
+                    }
+                    .status-panel input,
+                    .status-panel select {
+                        padding: 6px;
+                        margin-right: 5px;
+                    }
+                    #status-result {
+                        margin-top: 10px;
+                    }
                 </style>
             </head>
             <body>
                 <div class="container">
                     <div class="header">
                         <h1>Monitor de Webhook - Mercado Pago</h1>
-                        <button class="refresh-btn" onclick="location.reload()">Actualizar</button>
+                        <div>
+                            <span id="live-status" class="live-status">Conectando...</span>
+                            <button class="refresh-btn" onclick="location.reload()">Actualizar</button>
+                        </div>
                     </div>
                     
-                    {% if notifications %}
-                        <div class="card-container">
-                            {% for notification in notifications %}
-                                <div class="card">
-                                    <div class="card-header">
-                                        <div class="timestamp">{{ notification.timestamp }}</div>
-                                        {% set type = notification.data.get('type', 'desconocido') %}
-                                        <div class="notification-type 
-                                            {% if type == 'payment' %}type-payment
-                                            {% elif type == 'transfer' %}type-transfer
-                                            {% else %}type-other{% endif %}">
-                                            Tipo: {{ type }}
-                                        </div>
+                    {% if status_enabled %}
+                        <div class="status-panel">
+                            <form id="status-form" onsubmit="lookupStatus(event)">
+                                <select id="status-type">
+                                    <option value="payment">Pago</option>
+                                    <option value="transfer">Transferencia</option>
+                                </select>
+                                <input id="status-id" placeholder="ID del recurso" required>
+                                <button class="refresh-btn" type="submit">Consultar estado</button>
+                                <span id="status-counts" class="live-status"></span>
+                            </form>
+                            <div id="status-result"></div>
+                        </div>
+                    {% endif %}
+                    
+                    <div class="card-container" id="card-container">
+                        {% for notification in notifications %}
+                            <div class="card" data-seq="{{ notification.seq }}">
+                                <div class="card-header">
+                                    <div class="timestamp">{{ notification.timestamp }}</div>
+                                    {% set type = notification.data.get('type', 'desconocido') %}
+                                    <div class="notification-type 
+                                        {% if type == 'payment' %}type-payment
+                                        {% elif type == 'transfer' %}type-transfer
+                                        {% else %}type-other{% endif %}">
+                                        Tipo: {{ type }}
                                     </div>
-                                    <div class="card-body">
-                                        {% if notification.data.get('data') %}
-                                            {% if notification.data.data.get('id') %}
-                                                <div class="card-details">
-                                                    <span class="detail-label">ID:</span>
-                                                    {{ notification.data.data.id }}
-                                                </div>
-                                            {% endif %}
-                                            
-                                            {% if notification.data.data.get('amount') %}
-                                                <div class="card-details">
-                                                    <span class="detail-label">Monto:</span>
-                                                    {{ notification.data.data.amount }}
-                                                    {% if notification.data.data.get('currency') %}
-                                                        {{ notification.data.data.currency }}
-                                                    {% endif %}
-                                                </div>
-                                            {% endif %}
-                                            
-                                            {% if notification.data.data.get('status') %}
-                                                <div class="card-details">
-                                                    <span class="detail-label">Estado:</span>
-                                                    {{ notification.data.data.status }}
-                                                </div>
-                                            {% endif %}
-                                            
-                                            {% if notification.data.data.get('description') %}
-                                                <div class="card-details">
-                                                    <span class="detail-label">Descripción:</span>
-                                                    {{ notification.data.data.description }}
-                                                </div>
+                                </div>
+                                <div class="card-body">
+                                    {% set card = summary(notification) %}
+                                    {% if card.id %}
+                                        <div class="card-details">
+                                            <span class="detail-label">ID:</span>
+                                            {{ card.id }}
+                                        </div>
+                                    {% endif %}
+                                    
+                                    {% if card.amount %}
+                                        <div class="card-details">
+                                            <span class="detail-label">Monto:</span>
+                                            {{ card.amount }}
+                                            {% if card.currency %}
+                                                {{ card.currency }}
                                             {% endif %}
-                                        {% endif %}
-                                        
-                                        {% if notification.data.get('action') %}
-                                            <div class="card-details">
-                                                <span class="detail-label">Acción:</span>
-                                                {{ notification.data.action }}
-                                            </div>
-                                        {% endif %}
-                                    </div>
-                                    <button class="view-json-btn" onclick="showJson({{ loop.index0 }})">Ver JSON completo</button>
+                                        </div>
+                                    {% endif %}
+                                    
+                                    {% if card.status %}
+                                        <div class="card-details">
+                                            <span class="detail-label">Estado:</span>
+                                            {{ card.status }}
+                                        </div>
+                                    {% endif %}
+                                    
+                                    {% if card.description %}
+                                        <div class="card-details">
+                                            <span class="detail-label">Descripción:</span>
+                                            {{ card.description }}
+                                        </div>
+                                    {% endif %}
+                                    
+                                    {% if notification.data.get('action') %}
+                                        <div class="card-details">
+                                            <span class="detail-label">Acción:</span>
+                                            {{ notification.data.action }}
+                                        </div>
+                                    {% endif %}
                                 </div>
-                            {% endfor %}
-                        </div>
-                    {% else %}
-                        <div class="empty-state">
+                                <button class="view-json-btn" onclick="showJson({{ notification.seq }})">Ver JSON completo</button>
+                            </div>
+                        {% endfor %}
+                    </div>
+                    {% if next_cursor is not none %}
+                        <button class="view-json-btn" id="load-more-btn" onclick="loadMore()">Cargar más</button>
+                    {% endif %}
+                    {% if not notifications %}
+                        <div class="empty-state" id="empty-state">
                             <h2>No se han recibido notificaciones</h2>
                             <p>Las notificaciones aparecerán aquí cuando Mercado Pago envíe datos a tu webhook.</p>
                         </div>
@@ -329,22 +1163,50 @@ def webhook_view():
                 </div>
                 
                 <script>
-                    // Almacenar los datos JSON para cada notificación
-                    const notificationsData = [
-                        {% for notification in notifications %}
-                            {{ notification.data|tojson }},
-                        {% endfor %}
-                    ];
+                    // JSON completo de cada notificación, se pide al servidor sólo al abrirlo
+                    const notificationsData = {};
+                    const viewLimit = {{ view_limit }};
+                    let nextCursor = {{ next_cursor|tojson }};
                     
                     // Funciones para el modal
                     const modal = document.getElementById("jsonModal");
                     const jsonContent = document.getElementById("json-content");
                     const modalTitle = document.getElementById("modal-title");
                     
-                    function showJson(index) {
-                        const data = notificationsData[index];
-                        jsonContent.textContent = JSON.stringify(data, null, 2);
+                    function showJson(seq) {
+                        if (seq in notificationsData) {
+                            jsonContent.textContent = JSON.stringify(notificationsData[seq], null, 2);
+                            modal.style.display = "block";
+                            return;
+                        }
+                        jsonContent.textContent = "Cargando...";
                         modal.style.display = "block";
+                        fetch("/webhook/notifications/" + seq + "/raw")
+                            .then(function(response) {
+                                if (!response.ok) throw new Error("La notificación ya no está en el historial");
+                                return response.json();
+                            })
+                            .then(function(data) {
+                                notificationsData[seq] = data;
+                                jsonContent.textContent = JSON.stringify(data, null, 2);
+                            })
+                            .catch(function(error) {
+                                jsonContent.textContent = error.message;
+                            });
+                    }
+                    
+                    // Página siguiente del historial a través de la API
+                    function loadMore() {
+                        if (nextCursor === null) return;
+                        fetch("/webhook/notifications?cursor=" + nextCursor + "&limit=" + viewLimit)
+                            .then(function(response) { return response.json(); })
+                            .then(function(page) {
+                                page.items.forEach(function(notification) {
+                                    cardContainer.appendChild(renderCard(notification));
+                                });
+                                nextCursor = page.next_cursor;
+                                if (nextCursor === null) loadMoreBtn.style.display = "none";
+                            });
                     }
                     
                     function closeModal() {
@@ -357,15 +1219,161 @@ def webhook_view():
                             closeModal();
                         }
                     }
+                    
+                    // Tarjetas nuevas recibidas por Server-Sent Events
+                    const cardContainer = document.getElementById("card-container");
+                    const liveStatus = document.getElementById("live-status");
+                    const loadMoreBtn = document.getElementById("load-more-btn");
+                    
+                    function addDetail(body, label, value) {
+                        const detail = document.createElement("div");
+                        detail.className = "card-details";
+                        const labelSpan = document.createElement("span");
+                        labelSpan.className = "detail-label";
+                        labelSpan.textContent = label;
+                        detail.appendChild(labelSpan);
+                        detail.appendChild(document.createTextNode(" " + value));
+                        body.appendChild(detail);
+                    }
+                    
+                    function renderCard(notification) {
+                        const type = notification.type || "desconocido";
+                        const card = document.createElement("div");
+                        card.className = "card";
+                        card.dataset.seq = notification.seq;
+                        
+                        const header = document.createElement("div");
+                        header.className = "card-header";
+                        const timestamp = document.createElement("div");
+                        timestamp.className = "timestamp";
+                        timestamp.textContent = notification.timestamp;
+                        const badge = document.createElement("div");
+                        badge.className = "notification-type " + (type === "payment" ? "type-payment" : type === "transfer" ? "type-transfer" : "type-other");
+                        badge.textContent = "Tipo: " + type;
+                        header.appendChild(timestamp);
+                        header.appendChild(badge);
+                        
+                        const body = document.createElement("div");
+                        body.className = "card-body";
+                        if (notification.id) addDetail(body, "ID:", notification.id);
+                        if (notification.amount) addDetail(body, "Monto:", notification.amount + (notification.currency ? " " + notification.currency : ""));
+                        if (notification.status) addDetail(body, "Estado:", notification.status);
+                        if (notification.description) addDetail(body, "Descripción:", notification.description);
+                        if (notification.action) addDetail(body, "Acción:", notification.action);
+                        
+                        const button = document.createElement("button");
+                        button.className = "view-json-btn";
+                        button.textContent = "Ver JSON completo";
+                        button.onclick = function() { showJson(notification.seq); };
+                        
+                        card.appendChild(header);
+                        card.appendChild(body);
+                        card.appendChild(button);
+                        return card;
+                    }
+                    
+                    // Estado actual de un pago o transferencia desde el índice de estados
+                    const statusForm = document.getElementById("status-form");
+                    const statusResult = document.getElementById("status-result");
+                    const statusCounts = document.getElementById("status-counts");
+                    let countsTimer = null;
+                    
+                    function lookupStatus(event) {
+                        event.preventDefault();
+                        const type = document.getElementById("status-type").value;
+                        const id = document.getElementById("status-id").value.trim();
+                        statusResult.textContent = "Consultando...";
+                        fetch("/webhook/status/" + encodeURIComponent(type) + "/" + encodeURIComponent(id))
+                            .then(function(response) {
+                                if (!response.ok) throw new Error("Sin notificaciones para ese ID");
+                                return response.json();
+                            })
+                            .then(function(current) {
+                                statusResult.textContent = "";
+                                if (current.status) addDetail(statusResult, "Estado:", current.status + (current.status_detail ? " (" + current.status_detail + ")" : ""));
+                                if (current.amount !== null) addDetail(statusResult, "Monto:", current.amount + (current.currency ? " " + current.currency : ""));
+                                if (current.action) addDetail(statusResult, "Última acción:", current.action);
+                                addDetail(statusResult, "Actualizado:", new Date(current.event_time * 1000).toLocaleString());
+                            })
+                            .catch(function(error) {
+                                statusResult.textContent = error.message;
+                            });
+                    }
+                    
+                    function loadStatusCounts() {
+                        countsTimer = null;
+                        fetch("/webhook/status/counts")
+                            .then(function(response) { return response.json(); })
+                            .then(function(counts) {
+                                statusCounts.textContent = Object.keys(counts).map(function(status) {
+                                    return status + ": " + counts[status];
+                                }).join(" · ");
+                            });
+                    }
+                    
+                    if (statusForm) loadStatusCounts();
+                    
+                    if (window.EventSource) {
+                        const source = new EventSource("/webhook/stream?last_event_id={{ last_seq }}");
+                        source.onopen = function() {
+                            liveStatus.textContent = "● En vivo";
+                            liveStatus.className = "live-status connected";
+                        };
+                        source.onerror = function() {
+                            // Un 503 (demasiados clientes) cierra el stream y el navegador no reintenta
+                            liveStatus.textContent = source.readyState === EventSource.CLOSED
+                                ? "En vivo no disponible"
+                                : "Reconectando...";
+                            liveStatus.className = "live-status";
+                        };
+                        source.addEventListener("notification", function(event) {
+                            const notification = JSON.parse(event.data);
+                            const emptyState = document.getElementById("empty-state");
+                            if (emptyState) emptyState.remove();
+                            cardContainer.insertBefore(renderCard(notification), cardContainer.firstChild);
+                            // Los conteos se recalculan como mucho una vez por segundo
+                            if (statusForm && countsTimer === null) countsTimer = setTimeout(loadStatusCounts, 1000);
+                        });
+                        // Una notificación ya mostrada se completó con monto, moneda y estado de la API
+                        source.addEventListener("update", function(event) {
+                            const notification = JSON.parse(event.data);
+                            const current = cardContainer.querySelector('.card[data-seq="' + notification.seq + '"]');
+                            if (current) current.replaceWith(renderCard(notification));
+                            if (statusForm && countsTimer === null) countsTimer = setTimeout(loadStatusCounts, 1000);
+                        });
+                    } else {
+                        liveStatus.textContent = "";
+                    }
                 </script>
             </body>
         </html>
-    """, notifications=notifications_history)
+    """)
+# (versión del historial, html, etag, last-modified)
+view_cache = None
 
-@app.route("/", methods=["GET"])
-def home():
-    """Página de inicio con información sobre el servicio"""
-    return render_template_string("""
+@app.route("/webhook/view", methods=["GET"])
+def webhook_view():
+    """Página para visualizar las notificaciones recibidas en tarjetas simples"""
+    global view_cache
+    cached = view_cache
+    version = notifications_history.version
+    updated_at = notifications_history.updated_at
+    # Sólo se vuelve a renderizar cuando llegó una notificación nueva o se completó una con datos de la API
+    if cached is None or cached[0] != (version, updated_at):
+        notifications = notifications_history.latest(VIEW_LIMIT + 1)
+        html = WEBHOOK_VIEW_TEMPLATE.render(
+            notifications=notifications[:VIEW_LIMIT],
+            summary=notification_summary,
+            status_enabled=status_store is not None,
+            last_seq=version - 1,
+            view_limit=VIEW_LIMIT,
+            next_cursor=notifications[VIEW_LIMIT - 1].seq if len(notifications) > VIEW_LIMIT else None,
+        )
+        cached = ((version, updated_at), html, history_etag(version, updated_at), updated_at)
+        view_cache = cached
+    return conditional_response(cached[1], cached[2], cached[3])
+
+HOME_TEMPLATE = app.jinja_env.from_string("""
         <html>
             <head>
                 <title>Webhook para Mercado Pago</title>
@@ -450,6 +1458,63 @@ def home():
             </body>
         </html>
     """)
+# La página de inicio sólo depende del host con el que se accede
+home_cache = {}
+BOOT_TIME = time.time()
+
+@app.route("/", methods=["GET"])
+def home():
+    """Página de inicio con información sobre el servicio"""
+    host_url = request.host_url
+    cached = home_cache.get(host_url)
+    if cached is None:
+        html = HOME_TEMPLATE.render(request=request)
+        cached = (html, f"{BOOT_ID}-{hashlib.md5(html.encode('utf-8')).hexdigest()[:16]}")
+        # Evitar que un cliente con Host arbitrarios haga crecer el caché sin límite
+        if len(home_cache) < 32:
+            home_cache[host_url] = cached
+    return conditional_response(cached[0], cached[1], BOOT_TIME)
+
+# Worker de gunicorn en el que corre este proceso (None con el servidor de desarrollo)
+worker_slot = None
+
+def init_worker(slot, num_workers, worker_class="gthread", threads=1):
+    """Se llama en cada worker de gunicorn después del fork"""
+    global notification_log, worker_slot
+    worker_slot = slot
+    if worker_class not in ASYNC_WORKER_CLASSES:
+        # Cada stream SSE retiene un hilo: los streams nunca pueden ocupar todos los del worker
+        stream_limit = threads // 4
+        if not SSE_MAX_CLIENTS_SET:
+            broadcaster.max_subscribers = stream_limit
+        elif SSE_MAX_CLIENTS >= threads:
+            logging.warning(
+                "SSE_MAX_CLIENTS=%s con %s hilos por worker: los clientes de /webhook/stream pueden dejar sin hilos a /webhook",
+                SSE_MAX_CLIENTS, threads,
+            )
+    if num_workers > 1:
+        # Publicar los totales de este worker para que cualquiera los sume en /metrics
+        metrics.process_name = f"worker-{slot}"
+        metrics.start()
+    if notification_log is not None:
+        # Los archivos abiertos en el master no se comparten: con varios workers
+        # cada uno escribe su propia serie de segmentos
+        notification_log.close()
+        directory = NOTIFICATION_LOG_DIR
+        if num_workers > 1:
+            directory = os.path.join(NOTIFICATION_LOG_DIR, f"{WORKER_DIR_PREFIX}{slot}")
+        notification_log = open_notification_log(directory)
+
+def shutdown(timeout=None):
+    """Vacía la cola de procesamiento y baja el log a disco antes de terminar el proceso"""
+    processing_queue.stop(timeout)
+    dispatcher.shutdown()
+    if status_store is not None:
+        status_store.close(timeout)
+    if notification_log is not None:
+        notification_log.close()
+    if payment_client is not None:
+        payment_client.close()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
@@ -0,0 +1,82 @@
+import hashlib
+import hmac
+import time
+
+
+class InvalidSignatureError(Exception):
+    """La firma del webhook no es válida"""
+
+
+def parse_signature_header(header):
+    """Separa el header x-signature ("ts=...,v1=...") en (ts, v1)"""
+    ts = v1 = None
+    for part in header.split(","):
+        key, _, value = part.strip().partition("=")
+        if key == "ts":
+            ts = value
+        elif key == "v1":
+            v1 = value
+    return ts, v1
+
+
+def signature_manifest(data_id, request_id, ts):
+    """Texto que firma Mercado Pago: "id:...;request-id:...;ts:...;" omitiendo lo que no viene"""
+    manifest = ""
+    if data_id:
+        # Los ids alfanuméricos se firman en minúsculas
+        manifest += f"id:{data_id.lower()};"
+    if request_id:
+        manifest += f"request-id:{request_id};"
+    return manifest + f"ts:{ts};"
+
+
+class SignatureVerifier:
+    """Verifica el header x-signature de Mercado Pago.
+
+    Las claves se cargan una sola vez en objetos HMAC que luego se copian en
+    cada verificación. Acepta varias claves activas (rotación), rechaza
+    timestamps fuera de `tolerance` segundos y, si se le pasa un `replay_index`,
+    no acepta dos veces el mismo par (x-request-id, ts).
+    """
+
+    def __init__(self, secrets, tolerance=300, replay_index=None):
+        if not secrets:
+            raise ValueError("Se necesita al menos una clave para verificar firmas")
+        self._templates = [hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256) for secret in secrets]
+        self.tolerance = tolerance
+        self._replay_index = replay_index
+
+    def verify(self, signature_header, request_id, data_id, now=None):
+        """Devuelve el índice de la clave que firmó; lanza InvalidSignatureError si no corresponde a ninguna"""
+        if not signature_header:
+            raise InvalidSignatureError("Falta el header x-signature")
+        ts, v1 = parse_signature_header(signature_header)
+        return self.verify_parsed(ts, v1, request_id, data_id, now)
+
+    def verify_parsed(self, ts, v1, request_id, data_id, now=None):
+        """Como verify(), con el header x-signature ya separado por parse_signature_header()"""
+        if not ts or not v1:
+            raise InvalidSignatureError("Header x-signature mal formado")
+        try:
+            ts_seconds = int(ts)
+        except ValueError:
+            raise InvalidSignatureError("Timestamp de la firma inválido")
+        # Mercado Pago puede enviar el timestamp en milisegundos
+        if ts_seconds > 10**11:
+            ts_seconds //= 1000
+        now = time.time() if now is None else now
+        if abs(now - ts_seconds) > self.tolerance:
+            raise InvalidSignatureError("Timestamp de la firma vencido")
+
+        manifest = signature_manifest(data_id, request_id, ts).encode("utf-8")
+        for key_index, template in enumerate(self._templates):
+            mac = template.copy()
+            mac.update(manifest)
+            if hmac.compare_digest(mac.hexdigest(), v1):
+                break
+        else:
+            raise InvalidSignatureError("Firma inválida")
+
+        if self._replay_index is not None and request_id and self._replay_index.seen(f"{request_id}:{ts}"):
+            raise InvalidSignatureError("Notificación repetida (replay)")
+        return key_index
@@ -0,0 +1,216 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Marca para que el hilo escritor termine
+_STOP = object()
+
+# Columnas de estado que se devuelven en las consultas
+STATUS_COLUMNS = (
+    "resource_type", "resource_id", "status", "status_detail", "amount", "currency",
+    "description", "action", "event_time", "updated_at",
+)
+
+_UPSERT = (
+    "INSERT INTO resource_status (resource_type, resource_id, status, status_detail, amount, currency, "
+    "description, action, event_time, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(resource_type, resource_id) DO UPDATE SET "
+    "status = coalesce(excluded.status, status), "
+    "status_detail = coalesce(excluded.status_detail, status_detail), "
+    "amount = coalesce(excluded.amount, amount), "
+    "currency = coalesce(excluded.currency, currency), "
+    "description = coalesce(excluded.description, description), "
+    "action = excluded.action, event_time = excluded.event_time, updated_at = excluded.updated_at "
+    # Una actualización más vieja que la guardada (llegó fuera de orden) no pisa nada
+    "WHERE excluded.event_time >= resource_status.event_time"
+)
+_SELECT = "SELECT " + ", ".join(STATUS_COLUMNS) + " FROM resource_status"
+
+
+def event_time(*candidates):
+    """Primer timestamp válido (epoch o ISO 8601, como los de Mercado Pago) como epoch"""
+    for value in candidates:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if isinstance(value, str) and value:
+            try:
+                return datetime.fromisoformat(value).timestamp()
+            except ValueError:
+                continue
+    return time.time()
+
+
+class StatusStore:
+    """Último estado conocido de cada recurso (pago, transferencia...) en SQLite con WAL.
+
+    Las escrituras se encolan y un único hilo por proceso las aplica en tandas
+    de hasta `batch_size`, en una transacción por tanda. Las lecturas usan una
+    conexión por hilo y consultas por índice (id, estado, fecha), sin recorrer
+    el historial. Cada actualización lleva el momento del evento: si llega una
+    más vieja que la guardada se descarta.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=0.2, maxsize=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self._pid = None
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS resource_status ("
+            "resource_type TEXT NOT NULL, resource_id TEXT NOT NULL, status TEXT, status_detail TEXT, "
+            "amount REAL, currency TEXT, description TEXT, action TEXT, "
+            "event_time REAL NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (resource_type, resource_id)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS resource_status_status ON resource_status (status, event_time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS resource_status_time ON resource_status (event_time)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _writer_queue(self):
+        # El hilo escritor se crea con la primera escritura de cada proceso (después del fork de gunicorn)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.maxsize)
+                self._writer = threading.Thread(target=self._run, args=(self._queue,), name="status-writer", daemon=True)
+                self._writer.start()
+                self._pid = os.getpid()
+            return self._queue
+
+    def record(self, resource_type, resource_id, event_time, status=None, status_detail=None, amount=None,
+               currency=None, description=None, action=None):
+        """Encola una actualización de estado; si la cola está llena espera a que el escritor avance"""
+        self._writer_queue().put((
+            resource_type, str(resource_id), status, status_detail, amount, currency,
+            description, action, event_time, time.time(),
+        ))
+
+    def _run(self, updates):
+        conn = self._connection()
+        stopping = False
+        while not stopping:
+            item = updates.get()
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            # Juntar lo que llegue durante flush_interval (o hasta llenar la tanda)
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    self._write(conn, batch)
+                    batch = []
+                    item.set()
+                else:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = updates.get(timeout=remaining) if remaining > 0 else updates.get_nowait()
+                except queue.Empty:
+                    break
+            self._write(conn, batch)
+
+    def _write(self, conn, batch):
+        if not batch:
+            return
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(_UPSERT, batch)
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            # El hilo escritor no puede morir: se pierde la tanda pero se sigue escribiendo
+            logging.error("No se pudieron guardar %s estados: %s", len(batch), e)
+            self.failed += len(batch)
+            return
+        self.written += len(batch)
+        self.batches += 1
+
+    def flush(self, timeout=None):
+        """Espera a que se escriba todo lo encolado hasta ahora en este proceso"""
+        if self._pid != os.getpid():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        """Escribe lo pendiente y detiene el hilo escritor"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            writer, updates = self._writer, self._queue
+            self._pid = None
+        updates.put(_STOP)
+        writer.join(timeout)
+
+    def _rows(self, query, params):
+        return [dict(zip(STATUS_COLUMNS, row)) for row in self._connection().execute(query, params)]
+
+    def get(self, resource_type, resource_id):
+        rows = self._rows(_SELECT + " WHERE resource_type = ? AND resource_id = ?", (resource_type, str(resource_id)))
+        return rows[0] if rows else None
+
+    def find(self, resource_type=None, status=None, since=None, until=None, limit=100):
+        """Recursos filtrados por tipo, estado y rango de fechas, del evento más nuevo al más viejo"""
+        conditions = []
+        params = []
+        for column, value, operator in (
+            ("resource_type", resource_type, "="),
+            ("status", status, "="),
+            ("event_time", since, ">="),
+            ("event_time", until, "<="),
+        ):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        query = _SELECT
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY event_time DESC LIMIT ?"
+        params.append(limit)
+        return self._rows(query, params)
+
+    def counts(self, resource_type=None):
+        """Cantidad de recursos por estado ("unknown" para los que todavía no tienen uno)"""
+        query = "SELECT status, count(*) FROM resource_status"
+        params = ()
+        if resource_type is not None:
+            query += " WHERE resource_type = ?"
+            params = (resource_type,)
+        query += " GROUP BY status"
+        return {status or "unknown": count for status, count in self._connection().execute(query, params)}
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize() if self._pid == os.getpid() else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
@@ -0,0 +1,337 @@
+import heapq
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+import payloads
+
+# Cabecera de cada registro: largo del cuerpo, crc32, timestamp, largo de los headers
+RECORD_HEADER = struct.Struct("<IIdI")
+TIMESTAMP = struct.Struct("<d")
+SEGMENT_SUFFIX = ".log"
+INDEX_SUFFIX = ".idx"
+# Con varios workers de gunicorn cada uno escribe en su propio subdirectorio
+WORKER_DIR_PREFIX = "worker-"
+
+
+def list_segments(directory):
+    """Números de los segmentos de un directorio, en orden"""
+    return sorted(
+        int(name[:-len(SEGMENT_SUFFIX)])
+        for name in os.listdir(directory)
+        if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+    )
+
+
+def segment_path(directory, segment):
+    return os.path.join(directory, f"{segment:08d}{SEGMENT_SUFFIX}")
+
+
+def replay_segments(directory, segments):
+    """Recorre los registros de los segmentos dados, cada uno con su propio mmap"""
+    for segment in segments:
+        # mmap propio: si una compactación borra el segmento, el mapeo sigue siendo válido
+        try:
+            with open(segment_path(directory, segment), "rb") as segment_file:
+                if os.fstat(segment_file.fileno()).st_size == 0:
+                    continue
+                mapped = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            continue
+        try:
+            yield from scan_records(mapped, segment)
+        finally:
+            mapped.close()
+
+
+def replay_directory(root):
+    """Registros del directorio raíz y de los subdirectorios de cada worker, ordenados por timestamp"""
+    if not os.path.isdir(root):
+        return iter(())
+    directories = [root] + sorted(
+        os.path.join(root, name)
+        for name in os.listdir(root)
+        if name.startswith(WORKER_DIR_PREFIX) and os.path.isdir(os.path.join(root, name))
+    )
+    streams = [replay_segments(directory, list_segments(directory)) for directory in directories]
+    return heapq.merge(*streams, key=lambda record: record.timestamp)
+
+
+def record_crc(timestamp, headers_bytes, body):
+    """crc32 del timestamp, los headers y el cuerpo de un registro"""
+    return zlib.crc32(body, zlib.crc32(headers_bytes, zlib.crc32(TIMESTAMP.pack(timestamp))))
+
+
+def read_record(mapped, segment, offset):
+    """Lee el registro en `offset`; None si está incompleto o corrupto"""
+    if offset + RECORD_HEADER.size > len(mapped):
+        return None
+    body_len, crc, timestamp, headers_len = RECORD_HEADER.unpack_from(mapped, offset)
+    start = offset + RECORD_HEADER.size
+    end = start + headers_len + body_len
+    if end > len(mapped):
+        return None
+    headers_bytes = mapped[start:start + headers_len]
+    body = mapped[start + headers_len:end]
+    if record_crc(timestamp, headers_bytes, body) != crc:
+        return None
+    try:
+        headers = json.loads(headers_bytes)
+    except ValueError:
+        # Headers ilegibles: se trata igual que un registro incompleto, como el fin de los datos válidos
+        return None
+    return LogRecord(segment, offset, end - offset, timestamp, headers, body)
+
+
+def scan_records(mapped, segment):
+    offset = 0
+    while True:
+        record = read_record(mapped, segment, offset)
+        if record is None:
+            return
+        yield record
+        offset += record.size
+
+
+class LogRecord:
+    """Registro leído del log de notificaciones"""
+
+    __slots__ = ("segment", "offset", "size", "timestamp", "headers", "body")
+
+    def __init__(self, segment, offset, size, timestamp, headers, body):
+        self.segment = segment
+        self.offset = offset
+        self.size = size
+        self.timestamp = timestamp
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return payloads.loads(self.body)
+
+
+class NotificationLog:
+    """Log append-only en segmentos con fsync agrupado (group commit).
+
+    Cada notificación se agrega al segmento activo con un write con buffer; un
+    hilo hace flush + fsync cada `fsync_interval` segundos para todo lo que se
+    acumuló. Cada segmento tiene un archivo .idx con "id offset" por línea para
+    buscar por id de notificación, y las lecturas usan mmap.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, max_segments=16, fsync_interval=0.05):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._durable = threading.Condition(self._lock)
+        self._index = {}
+        self._maps = {}
+        self._segments = list_segments(directory)
+        for segment in self._segments:
+            self._load_index(segment)
+        if not self._segments:
+            self._segments.append(1)
+        self._active = self._segments[-1]
+        self._repair_tail(self._active)
+        self._file = open(self._segment_path(self._active), "ab")
+        self._index_file = open(self._index_path(self._active), "a", encoding="utf-8")
+        self._size = self._file.tell()
+        # Secuencia de escrituras y la última que ya está en disco
+        self._written = 0
+        self._synced = 0
+        self._closed = False
+        self._syncer = None
+
+    def _segment_path(self, segment):
+        return segment_path(self.directory, segment)
+
+    def _index_path(self, segment):
+        return os.path.join(self.directory, f"{segment:08d}{INDEX_SUFFIX}")
+
+    def _load_index(self, segment):
+        try:
+            with open(self._index_path(segment), encoding="utf-8") as index_file:
+                for line in index_file:
+                    notification_id, _, offset = line.rstrip("\n").rpartition(" ")
+                    if notification_id and offset.isdigit():
+                        self._index.setdefault(notification_id, []).append((segment, int(offset)))
+        except FileNotFoundError:
+            pass
+
+    def _repair_tail(self, segment):
+        """Descarta un registro incompleto al final del segmento (caída a mitad de escritura)"""
+        path = self._segment_path(segment)
+        if not os.path.exists(path):
+            return
+        valid = 0
+        mapped = self._map(segment)
+        if mapped is not None:
+            for record in scan_records(mapped, segment):
+                valid = record.offset + record.size
+        if valid < os.path.getsize(path):
+            logging.warning("Log de notificaciones: se trunca el segmento %s en %s bytes", segment, valid)
+            with open(path, "r+b") as segment_file:
+                segment_file.truncate(valid)
+
+    def start(self):
+        """Inicia el hilo de group commit (una sola vez por proceso)"""
+        with self._lock:
+            if self._syncer is not None:
+                return
+            self._syncer = threading.Thread(target=self._sync_loop, name="notification-log-sync", daemon=True)
+            self._syncer.start()
+
+    def append(self, body, headers, timestamp=None, notification_id=None, durable=False):
+        """Agrega una notificación al log.
+
+        Con `durable=True` espera a que el próximo fsync agrupado la incluya.
+        """
+        return self.append_many([(body, headers, timestamp, notification_id)], durable=durable)[0]
+
+    def append_many(self, notifications, durable=False):
+        """Agrega varias notificaciones (body, headers, timestamp, id) tomando el lock una sola vez"""
+        if self._syncer is None:
+            self.start()
+        records = []
+        for body, headers, timestamp, notification_id in notifications:
+            timestamp = time.time() if timestamp is None else timestamp
+            headers_bytes = json.dumps(headers).encode("utf-8")
+            records.append((
+                RECORD_HEADER.pack(len(body), record_crc(timestamp, headers_bytes, body), timestamp, len(headers_bytes))
+                + headers_bytes + body,
+                notification_id,
+            ))
+        positions = []
+        with self._lock:
+            for record, notification_id in records:
+                if self._size and self._size + len(record) > self.segment_bytes:
+                    self._rotate()
+                offset = self._size
+                self._file.write(record)
+                self._size += len(record)
+                if notification_id is not None:
+                    self._index_file.write(f"{notification_id} {offset}\n")
+                    self._index.setdefault(str(notification_id), []).append((self._active, offset))
+                positions.append((self._active, offset))
+            self._written += 1
+            position = self._written
+            if durable:
+                while self._synced < position and not self._closed:
+                    self._durable.wait()
+        return positions
+
+    def _rotate(self):
+        self._flush_locked(fsync=True)
+        self._file.close()
+        self._index_file.close()
+        self._active += 1
+        self._segments.append(self._active)
+        self._file = open(self._segment_path(self._active), "ab")
+        self._index_file = open(self._index_path(self._active), "a", encoding="utf-8")
+        self._size = 0
+        if len(self._segments) > self.max_segments:
+            self._compact_locked()
+
+    def compact(self):
+        """Elimina los segmentos más viejos que exceden `max_segments`"""
+        with self._lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        while len(self._segments) > self.max_segments:
+            segment = self._segments.pop(0)
+            mapped = self._maps.pop(segment, None)
+            if mapped is not None:
+                mapped[0].close()
+            for path in (self._segment_path(segment), self._index_path(segment)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            for notification_id in list(self._index):
+                locations = [loc for loc in self._index[notification_id] if loc[0] != segment]
+                if locations:
+                    self._index[notification_id] = locations
+                else:
+                    del self._index[notification_id]
+
+    def _flush_locked(self, fsync):
+        self._file.flush()
+        self._index_file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+            self._synced = self._written
+            self._durable.notify_all()
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                if self._closed:
+                    return
+                if self._synced < self._written:
+                    self._flush_locked(fsync=True)
+
+    def flush(self):
+        with self._lock:
+            if not self._closed:
+                self._flush_locked(fsync=True)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._flush_locked(fsync=True)
+            self._closed = True
+            self._durable.notify_all()
+            self._file.close()
+            self._index_file.close()
+            for mapped, _ in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+    def _map(self, segment):
+        """mmap del segmento; el activo se vuelve a mapear cuando creció"""
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        cached = self._maps.get(segment)
+        if cached is not None and cached[1] == size:
+            return cached[0]
+        if cached is not None:
+            cached[0].close()
+        if size == 0:
+            self._maps.pop(segment, None)
+            return None
+        with open(path, "rb") as segment_file:
+            mapped = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[segment] = (mapped, size)
+        return mapped
+
+    def get(self, notification_id):
+        """Registros guardados para un id de notificación, del más viejo al más nuevo"""
+        with self._lock:
+            if not self._closed:
+                self._flush_locked(fsync=False)
+            records = []
+            for segment, offset in self._index.get(str(notification_id), ()):
+                mapped = self._map(segment)
+                record = read_record(mapped, segment, offset) if mapped is not None else None
+                if record is not None:
+                    records.append(record)
+            return records
+
+    def replay(self):
+        """Recorre todos los registros del log en orden de escritura"""
+        with self._lock:
+            if not self._closed:
+                self._flush_locked(fsync=False)
+            segments = list(self._segments)
+        yield from replay_segments(self.directory, segments)
@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Los módulos de la app están en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+class StubApi(ThreadingHTTPServer):
+    """API de Mercado Pago falsa: responde con los estados encolados en `statuses` y después 200"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.statuses = []
+        self.requests = 0
+        self.delay = 0
+        # Pago que devuelve GET /v1/payments/<id>
+        self.payment = {"transaction_amount": 10.5, "currency_id": "ARS", "status": "approved"}
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            status = self.server.statuses.pop(0) if self.server.statuses else 200
+        time.sleep(self.server.delay)
+        payment_id = self.path.rsplit("/", 1)[-1]
+        body = json.dumps({"id": payment_id, **self.server.payment}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    server = StubApi()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,12 @@
+def test_batch_does_not_store_the_token(monkeypatch):
+    import server
+    monkeypatch.setattr(server, "BATCH_TOKEN", "s3cret")
+    client = server.app.test_client()
+    body = b'{"type": "batch_headers", "data": {"id": "1"}}\n'
+    response = client.post("/webhook/batch", data=body, headers={"Authorization": "Bearer s3cret", "Cookie": "a=b"})
+    assert response.status_code == 200
+    assert '"success"' in response.get_data(as_text=True)
+    entry = next(server.notifications_history.iter_entries(notification_type="batch_headers"))
+    headers = client.get(f"/webhook/notifications/{entry.seq}").get_json()["headers"]
+    assert "Authorization" not in headers and "Cookie" not in headers
+    assert headers["X-Import"] == "webhook_batch"
@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from broadcast import NotificationBroadcaster
+from history import NotificationHistory, SqliteHistory
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def history(request, tmp_path):
+    if request.param == "memory":
+        return NotificationHistory(capacity=10)
+    return SqliteHistory(str(tmp_path / "history.db"), capacity=10, poll_interval=0.01)
+
+
+def next_event(events):
+    event = next(events)
+    while event.startswith(":"):
+        event = next(events)
+    return event
+
+
+def test_enriched_entry_is_sent_as_an_update(history):
+    def serialize(entry):
+        return {"seq": entry.seq, "amount": (entry.resource or {}).get("amount")}
+    broadcaster = NotificationBroadcaster(history, serialize, heartbeat=0.05)
+    events = broadcaster.subscribe()
+    assert next(events).startswith("retry:")
+    entry = history.append("t", {"type": "payment", "data": {"id": 1}}, {})
+    assert json.loads(next_event(events).split("data: ", 1)[1]) == {"seq": entry.seq, "amount": None}
+    history.set_resource(entry.seq, {"amount": 100.5})
+    event = next_event(events)
+    assert event.startswith("event: update\n")
+    assert json.loads(event.split("data: ", 1)[1]) == {"seq": entry.seq, "amount": 100.5}
+    events.close()
+    assert broadcaster.subscribers == 0
@@ -0,0 +1,88 @@
+import pytest
+
+from dedup import DedupIndex, SqliteDedupBackend, notification_key
+
+
+def test_seen_marks_duplicates_within_ttl():
+    index = DedupIndex(ttl=60, resolution=1)
+    assert index.seen("payment:payment.created:1") is False
+    assert index.seen("payment:payment.created:1") is True
+    assert index.stats()["duplicates"] == 1
+
+
+def test_forget_lets_the_retry_through():
+    index = DedupIndex(ttl=60, resolution=1)
+    index.seen("k")
+    index.forget("k")
+    assert len(index) == 0
+    assert index.seen("k") is False
+
+
+def test_forget_removes_the_backend_row(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    index = DedupIndex(ttl=60, resolution=1, backend=SqliteDedupBackend(path))
+    index.seen("k")
+    index.forget("k")
+    # Otro proceso (otro índice sobre la misma base) tampoco la ve como duplicada
+    other = DedupIndex(ttl=60, resolution=1, backend=SqliteDedupBackend(path))
+    assert other.seen("k") is False
+
+
+def test_notification_key_without_id():
+    assert notification_key({"type": "payment"}) is None
+    assert notification_key({"type": "payment", "action": "a", "data": {"id": 5}}) == "payment:a:5"
+
+
+@pytest.fixture
+def client():
+    import server
+    return server.app.test_client()
+
+
+def test_failed_notification_is_not_a_duplicate_on_retry(client):
+    import server
+
+    calls = []
+
+    def failing(notification_entry):
+        calls.append(notification_entry)
+        raise RuntimeError("falla de prueba")
+
+    server.dispatcher.register("test_failure", failing)
+    notification = {"id": "dedup-retry-1", "type": "test_failure", "data": {"id": "1"}}
+    assert client.post("/webhook", json=notification).status_code == 500
+    # El reintento de Mercado Pago se procesa otra vez en lugar de responder "duplicate"
+    response = client.post("/webhook", json=notification)
+    assert response.status_code == 500
+    assert len(calls) == 2
+
+
+def test_batch_item_that_failed_is_retried_on_reimport(client):
+    import server
+
+    attempts = []
+
+    def flaky(notification_entry):
+        attempts.append(notification_entry)
+        if len(attempts) == 1:
+            raise RuntimeError("falla de prueba")
+
+    server.dispatcher.register("test_flaky", flaky)
+    body = b'{"id": "dedup-batch-1", "type": "test_flaky", "data": {"id": "2"}}\n'
+    first = client.post("/webhook/batch", data=body).get_data(as_text=True)
+    assert '"status": "error"' in first
+    second = client.post("/webhook/batch", data=body).get_data(as_text=True)
+    assert '"status": "success"' in second
+
+
+def test_backend_keeps_one_winner_across_threads(tmp_path):
+    import threading
+    index = DedupIndex(ttl=60, resolution=1, backend=SqliteDedupBackend(str(tmp_path / "dedup.db")))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(index.seen("k"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [False] + [True] * 7
+    assert index.stats()["unique"] == 1
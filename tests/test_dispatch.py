@@ -0,0 +1,49 @@
+def test_dead_letters_limit_must_be_positive():
+    import server
+    client = server.app.test_client()
+    assert client.get("/webhook/dead-letters?limit=-5").status_code == 400
+    assert client.get("/webhook/dead-letters?limit=0").status_code == 400
+    assert client.get("/webhook/dead-letters?limit=1").status_code == 200
+
+
+def test_dispatch_waits_for_a_pool_slot():
+    import threading
+    import time
+
+    from dispatch import DeadLetterStore, Dispatcher, HandlerPool
+
+    release = threading.Event()
+    dispatcher = Dispatcher(DeadLetterStore())
+    dispatcher.register("slow", lambda notification: release.wait(5))
+    dispatcher._pools["slow"] = HandlerPool("slow", workers=1, max_pending=1)
+    notification = {"data": {"type": "slow"}}
+    assert dispatcher.dispatch(notification) == "dispatched"
+    # Sin espera, el pool lleno manda la notificación a dead letters
+    assert dispatcher.dispatch(notification) == "dispatched"
+    assert dispatcher.dead_letters.total == 1
+    # Con espera, entra cuando el handler en curso libera su lugar
+    threading.Timer(0.1, release.set).start()
+    started = time.monotonic()
+    assert dispatcher.dispatch(notification, slot_timeout=5) == "dispatched"
+    assert time.monotonic() - started >= 0.05
+    assert dispatcher.dead_letters.total == 1
+    dispatcher.shutdown()
+
+
+def test_dead_letter_file_is_rotated_and_read_from_the_tail(tmp_path):
+    import os
+
+    from dispatch import DeadLetterStore, tail_lines
+
+    path = str(tmp_path / "dead.ndjson")
+    store = DeadLetterStore(path=path, max_bytes=2000)
+    for i in range(100):
+        store.add({"n": i, "error": "x" * 20})
+    store.close()
+    assert os.path.getsize(path) < 2000
+    assert os.path.getsize(path + ".1") < 2100
+    # Las más nuevas primero, aunque haya que seguir en el archivo rotado
+    letters = store.latest(30)
+    assert [letter["n"] for letter in letters] == list(range(99, 69, -1))
+    # Leer la cola del archivo no depende de cortar en un límite de bloque
+    assert tail_lines(path, 3, block_size=7) == tail_lines(path, 3)
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from enrichment import CircuitOpenError, EnrichmentError, MercadoPagoClient, ResourceNotFoundError
+
+
+def make_client(api, **options):
+    options.setdefault("backoff", 0.001)
+    return MercadoPagoClient("token", base_url=f"http://127.0.0.1:{api.server_port}", timeout=2, **options)
+
+
+def test_retries_transient_errors(api):
+    api.statuses = [503, 429]
+    client = make_client(api, retries=2)
+    payment = client.get_payment(1)
+    assert payment["amount"] == 10.5 and payment["status"] == "approved"
+    assert api.requests == 3
+    # La segunda consulta sale de la caché
+    client.get_payment(1)
+    assert api.requests == 3
+
+
+def test_client_errors_are_not_retried(api):
+    api.statuses = [404, 401]
+    client = make_client(api, retries=2)
+    with pytest.raises(ResourceNotFoundError):
+        client.get_payment(1)
+    with pytest.raises(EnrichmentError):
+        client.get_payment(2)
+    assert api.requests == 2
+    assert client.breaker.state == "closed"
+
+
+def test_concurrent_lookups_are_coalesced(api):
+    api.delay = 0.2
+    client = make_client(api)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.get_payment(7))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 10 and all(result == results[0] for result in results)
+    assert api.requests == 1
+    assert client.stats()["coalesced"] == 9
+
+
+def test_breaker_opens_and_recovers(api):
+    client = make_client(api, retries=0, failure_threshold=2, reset_timeout=0.2)
+    api.statuses = [500, 500]
+    for payment_id in (1, 2):
+        with pytest.raises(EnrichmentError):
+            client.get_payment(payment_id)
+    assert client.breaker.state == "open"
+    # Con el circuito abierto no se consulta la API
+    with pytest.raises(CircuitOpenError):
+        client.get_payment(3)
+    assert api.requests == 2
+
+    time.sleep(0.25)
+    assert client.breaker.state == "half_open"
+    # La consulta de prueba falla: el circuito se vuelve a abrir
+    api.statuses = [500]
+    with pytest.raises(EnrichmentError):
+        client.get_payment(4)
+    assert client.breaker.state == "open"
+
+    time.sleep(0.25)
+    assert client.get_payment(5)["status"] == "approved"
+    assert client.breaker.state == "closed"
+    assert api.requests == 4
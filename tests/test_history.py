@@ -0,0 +1,49 @@
+import pytest
+
+from history import NotificationHistory, SqliteHistory
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def history(request, tmp_path):
+    if request.param == "memory":
+        return NotificationHistory(capacity=10)
+    return SqliteHistory(str(tmp_path / "history.db"), capacity=10)
+
+
+def test_since_until_compare_arrival_time(history):
+    for received_at in (100.0, 200.0, 300.0):
+        history.append("t", {"type": "payment", "data": {"id": received_at}}, {}, received_at=received_at)
+    assert [entry.received_at for entry in history.iter_entries(since=150)] == [300.0, 200.0]
+    assert [entry.received_at for entry in history.iter_entries(until=250)] == [200.0, 100.0]
+    assert [entry.received_at for entry in history.iter_entries(since=150, until=250)] == [200.0]
+
+
+def test_notifications_rejects_invalid_dates():
+    import server
+    client = server.app.test_client()
+    assert client.get("/webhook/notifications?since=zzz").status_code == 400
+    assert client.get("/webhook/notifications?until=2024-13-01").status_code == 400
+    assert client.get("/webhook/notifications?since=2024-01-01T00:00:00").status_code == 200
+
+
+def test_type_filter_pages_through_the_index():
+    history = NotificationHistory(capacity=1000)
+    for i in range(1200):
+        history.append("t", {"type": "payment" if i % 3 else "transfer", "data": {"id": i % 7}}, {})
+    payments = [entry.seq for entry in history.iter_entries(notification_type="payment")]
+    assert payments == [seq for seq in range(1199, 199, -1) if seq % 3]
+    # Con cursor sólo se recorre lo anterior a él
+    assert [entry.seq for entry in history.iter_entries(notification_type="payment", before=500, limit=3)] == [499, 497, 496]
+    assert [entry.seq for entry in history.iter_entries(notification_id=3, limit=2)] == [1193, 1186]
+
+
+def test_view_etag_differs_between_workers(monkeypatch):
+    import server
+    monkeypatch.setattr(server, "HISTORY_DB_PATH", None)
+    monkeypatch.setattr(server.os, "getpid", lambda: 1001)
+    first = server.history_etag(5, 10.0)
+    monkeypatch.setattr(server.os, "getpid", lambda: 1002)
+    assert server.history_etag(5, 10.0) != first
+    # Con el historial compartido todos los workers ven lo mismo
+    monkeypatch.setattr(server, "HISTORY_DB_PATH", "history.db")
+    assert server.history_etag(5, 10.0) == f"{server.BOOT_ID}-5-10000"
@@ -0,0 +1,50 @@
+from ratelimit import TokenBucketLimiter, retry_after_header
+
+
+def test_burst_then_refill():
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    assert [limiter.allow("a", now=0) for _ in range(3)] == [0, 0, 0]
+    # Sin tokens: hay que esperar lo que tarda en llegar uno
+    assert limiter.allow("a", now=0) == 0.5
+    assert limiter.allow("a", now=0.25) == 0.25
+    assert limiter.allow("a", now=0.5) == 0
+    # La recarga nunca supera la ráfaga
+    assert [limiter.allow("a", now=100) for _ in range(4)][-1] > 0
+    assert limiter.stats()["allowed"] == 7
+
+
+def test_keys_have_separate_buckets():
+    limiter = TokenBucketLimiter(rate=1, burst=1)
+    assert limiter.allow("a", now=0) == 0
+    assert limiter.allow("a", now=0) > 0
+    assert limiter.allow("b", now=0) == 0
+
+
+def test_least_recently_used_key_is_evicted():
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=2)
+    limiter.allow("a", now=0)
+    limiter.allow("b", now=0)
+    # "a" se usa de nuevo: la inactiva es "b"
+    limiter.allow("a", now=0)
+    limiter.allow("c", now=0)
+    assert len(limiter) == 2
+    assert limiter.stats()["evicted"] == 1
+    # "b" vuelve con la ráfaga completa; "a" sigue sin tokens
+    assert limiter.allow("b", now=0) == 0
+    assert limiter.allow("c", now=0) > 0
+
+
+def test_retry_after_header_rounds_up():
+    assert retry_after_header(0.01) == "1"
+    assert retry_after_header(1.2) == "2"
+    assert retry_after_header(3) == "3"
+
+
+def test_webhook_answers_429_with_retry_after(monkeypatch):
+    import server
+    monkeypatch.setattr(server, "rate_limiter", TokenBucketLimiter(rate=0.5, burst=1))
+    client = server.app.test_client()
+    client.post("/webhook", json={"type": "rate_test", "data": {"id": "1"}})
+    response = client.post("/webhook", json={"type": "rate_test", "data": {"id": "2"}})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
@@ -0,0 +1,92 @@
+import hashlib
+import hmac
+
+import pytest
+
+from dedup import DedupIndex
+from signature import InvalidSignatureError, SignatureVerifier, parse_signature_header, signature_manifest
+
+NOW = 1_700_000_000
+
+
+def sign(secret, manifest):
+    return hmac.new(secret.encode("utf-8"), manifest.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def header(secret, data_id="123", request_id="req-1", ts=NOW):
+    return f"ts={ts},v1={sign(secret, signature_manifest(data_id, request_id, ts))}"
+
+
+def test_manifest_omits_missing_parts():
+    assert signature_manifest("123", "req-1", 5) == "id:123;request-id:req-1;ts:5;"
+    assert signature_manifest(None, "req-1", 5) == "request-id:req-1;ts:5;"
+    assert signature_manifest("123", None, 5) == "id:123;ts:5;"
+    # Los ids alfanuméricos se firman en minúsculas
+    assert signature_manifest("ABC9", None, 5) == "id:abc9;ts:5;"
+
+
+def test_parse_signature_header():
+    assert parse_signature_header("ts=1, v1=abc") == ("1", "abc")
+    assert parse_signature_header("v1=abc") == (None, "abc")
+
+
+@pytest.mark.parametrize("data_id, request_id", [("123", "req-1"), (None, "req-1"), ("123", None), ("ABC9", "req-1")])
+def test_valid_signature(data_id, request_id):
+    verifier = SignatureVerifier(["secret"])
+    signature = header("secret", data_id=data_id and data_id.lower(), request_id=request_id)
+    assert verifier.verify(signature, request_id, data_id, now=NOW) == 0
+
+
+def test_millisecond_timestamp():
+    verifier = SignatureVerifier(["secret"], tolerance=300)
+    assert verifier.verify(header("secret", ts=NOW * 1000 + 250), "req-1", "123", now=NOW + 10) == 0
+
+
+def test_rotation_returns_the_matching_key():
+    verifier = SignatureVerifier(["new", "old"])
+    assert verifier.verify(header("new"), "req-1", "123", now=NOW) == 0
+    assert verifier.verify(header("old"), "req-1", "123", now=NOW) == 1
+    with pytest.raises(InvalidSignatureError):
+        verifier.verify(header("other"), "req-1", "123", now=NOW)
+
+
+def test_tampered_id_is_rejected():
+    verifier = SignatureVerifier(["secret"])
+    with pytest.raises(InvalidSignatureError):
+        verifier.verify(header("secret", data_id="123"), "req-1", "124", now=NOW)
+
+
+def test_stale_timestamp():
+    verifier = SignatureVerifier(["secret"], tolerance=300)
+    with pytest.raises(InvalidSignatureError, match="vencido"):
+        verifier.verify(header("secret"), "req-1", "123", now=NOW + 301)
+    with pytest.raises(InvalidSignatureError, match="vencido"):
+        verifier.verify(header("secret"), "req-1", "123", now=NOW - 301)
+
+
+def test_replay_is_rejected():
+    verifier = SignatureVerifier(["secret"], replay_index=DedupIndex(ttl=600, resolution=1))
+    signature = header("secret")
+    verifier.verify(signature, "req-1", "123", now=NOW)
+    with pytest.raises(InvalidSignatureError, match="replay"):
+        verifier.verify(signature, "req-1", "123", now=NOW)
+
+
+@pytest.mark.parametrize("signature", ["", "ts=1", "v1=abc", "garbage", "ts=abc,v1=00"])
+def test_malformed_signature_is_rejected(signature):
+    verifier = SignatureVerifier(["secret"])
+    with pytest.raises(InvalidSignatureError):
+        verifier.verify(signature, "req-1", "123", now=NOW)
+
+
+@pytest.mark.parametrize("signature", [None, "ts=1", "v1=abc", "ts=abc,v1=00"])
+def test_webhook_rejects_malformed_signature(monkeypatch, signature):
+    import server
+    monkeypatch.setattr(server, "MP_VERIFY_SIGNATURE", True)
+    headers = {"X-Request-Id": "req-1"}
+    if signature is not None:
+        headers["X-Signature"] = signature
+    response = server.app.test_client().post(
+        "/webhook?data.id=123", json={"type": "payment", "data": {"id": "123"}}, headers=headers,
+    )
+    assert response.status_code == 403
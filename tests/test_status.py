@@ -0,0 +1,83 @@
+import threading
+
+from status import StatusStore, event_time
+
+
+def test_older_update_does_not_overwrite_newer(tmp_path):
+    store = StatusStore(str(tmp_path / "status.db"))
+    store.record("payment", 1, event_time=200.0, status="approved", amount=10.0)
+    store.record("payment", 1, event_time=100.0, status="pending", amount=5.0)
+    assert store.flush(timeout=5)
+    row = store.get("payment", 1)
+    assert (row["status"], row["amount"], row["event_time"]) == ("approved", 10.0, 200.0)
+    store.close()
+
+
+def test_newer_update_keeps_known_fields(tmp_path):
+    store = StatusStore(str(tmp_path / "status.db"))
+    store.record("payment", 1, event_time=100.0, status="pending", amount=5.0, currency="ARS")
+    store.record("payment", 1, event_time=200.0, status="approved")
+    assert store.flush(timeout=5)
+    row = store.get("payment", 1)
+    assert (row["status"], row["amount"], row["currency"]) == ("approved", 5.0, "ARS")
+    assert store.counts() == {"approved": 1}
+    store.close()
+
+
+def test_payment_status_comes_from_the_api(api, tmp_path, monkeypatch):
+    import server
+    from enrichment import MercadoPagoClient
+    # El pago se actualizó antes de que llegara la notificación
+    api.payment = {"transaction_amount": 100.5, "currency_id": "ARS", "status": "approved",
+                   "date_last_updated": "2024-01-01T10:00:00.000-03:00"}
+    store = StatusStore(str(tmp_path / "status.db"))
+    monkeypatch.setattr(server, "status_store", store)
+    monkeypatch.setattr(server, "payment_client", MercadoPagoClient(
+        "token", base_url=f"http://127.0.0.1:{api.server_port}", timeout=2,
+    ))
+    client = server.app.test_client()
+    response = client.post("/webhook", json={
+        "type": "payment", "action": "payment.updated", "date_created": "2024-01-01T10:05:00.000-03:00",
+        "data": {"id": "555"},
+    })
+    assert response.status_code == 200
+    assert store.flush(timeout=5)
+    status = client.get("/webhook/status/payment/555").get_json()
+    assert (status["status"], status["amount"], status["currency"]) == ("approved", 100.5, "ARS")
+    store.close()
+
+
+def test_concurrent_writers_keep_the_newest_event(tmp_path):
+    store = StatusStore(str(tmp_path / "status.db"), batch_size=7)
+    events = list(range(1, 201))
+
+    def write(times):
+        for value in times:
+            store.record("payment", 1, event_time=float(value), status=f"s{value}")
+
+    threads = [threading.Thread(target=write, args=(events[i::4][::-1],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.flush(timeout=5)
+    assert store.get("payment", 1)["status"] == "s200"
+    assert store.stats()["written"] == 200
+    store.close()
+
+
+def test_find_filters_by_status_and_time(tmp_path):
+    store = StatusStore(str(tmp_path / "status.db"))
+    store.record("payment", 1, event_time=100.0, status="approved")
+    store.record("payment", 2, event_time=200.0, status="approved")
+    store.record("payment", 3, event_time=300.0, status="rejected")
+    assert store.flush(timeout=5)
+    assert [row["resource_id"] for row in store.find(status="approved")] == ["2", "1"]
+    assert [row["resource_id"] for row in store.find(since=150, until=250)] == ["2"]
+    assert store.counts("payment") == {"approved": 2, "rejected": 1}
+    store.close()
+
+
+def test_event_time_parses_mercado_pago_dates():
+    assert event_time(None, "2024-01-01T10:00:00.000-03:00") == 1704114000.0
+    assert event_time("no es fecha", 5) == 5.0
@@ -0,0 +1,39 @@
+import os
+
+from storage import RECORD_HEADER, NotificationLog, replay_directory, segment_path
+
+
+def write_log(directory, count):
+    log = NotificationLog(str(directory))
+    for i in range(count):
+        log.append(b'{"id": %d}' % i, {"X-Request-Id": str(i)}, timestamp=1000.0 + i, notification_id=i)
+    log.close()
+    return segment_path(str(directory), 1)
+
+
+def bodies(directory):
+    return [record.body for record in replay_directory(str(directory))]
+
+
+def test_torn_tail_is_truncated_on_open(tmp_path):
+    path = write_log(tmp_path, 3)
+    size = os.path.getsize(path)
+    with open(path, "r+b") as segment_file:
+        segment_file.truncate(size - 3)
+    log = NotificationLog(str(tmp_path))
+    log.append(b'{"id": 9}', {}, timestamp=2000.0)
+    log.close()
+    assert bodies(tmp_path) == [b'{"id": 0}', b'{"id": 1}', b'{"id": 9}']
+
+
+def test_corrupt_headers_end_the_valid_data(tmp_path):
+    path = write_log(tmp_path, 3)
+    # Se rompe un byte de los headers del segundo registro: el CRC ya no coincide
+    second = os.path.getsize(path) * 1 // 3 + RECORD_HEADER.size + 2
+    with open(path, "r+b") as segment_file:
+        segment_file.seek(second)
+        segment_file.write(b"\xff")
+    assert bodies(tmp_path) == [b'{"id": 0}']
+    NotificationLog(str(tmp_path)).close()
+    assert os.path.getsize(path) < second
+